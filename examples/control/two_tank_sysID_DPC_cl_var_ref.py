@@ -96,7 +96,8 @@ problem.plot_graph()
 problem = problem.to(device)
 
 # %%
-optimizer = torch.optim.Adam(problem.parameters(), lr=0.001)
+fused = device.startswith("cuda")
+optimizer = torch.optim.Adam(problem.parameters(), lr=0.001, fused=fused, foreach=not fused)
 trainer_sysID = Trainer(
     problem,
     train_data,
@@ -230,7 +231,8 @@ problem.plot_graph()
 # device and optimizer
 device = "cpu"
 problem = problem.to(device)
-optimizer = torch.optim.AdamW(problem.parameters(), lr=0.001)
+fused = device.startswith("cuda")
+optimizer = torch.optim.AdamW(problem.parameters(), lr=0.001, fused=fused, foreach=not fused)
 # trainer
 cl_trainer = Trainer(
     problem,
@@ -226,7 +226,8 @@ if __name__ == "__main__":
     # device and optimizer
     device = f"cuda:{args.gpu}" if args.gpu is not None else "cpu"
     problem = problem.to(device)
-    optimizer = torch.optim.AdamW(problem.parameters(), lr=args.lr)
+    fused = device.startswith("cuda")
+    optimizer = torch.optim.AdamW(problem.parameters(), lr=args.lr, fused=fused, foreach=not fused)
 
     trainer = Trainer(
         problem,
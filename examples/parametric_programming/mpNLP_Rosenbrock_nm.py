@@ -319,8 +319,7 @@ if __name__ == "__main__":
     y_opt_nm = np.nan*np.ones([p_range.shape[0], a_range.shape[0]])
     filenames = []
     savedir = './Rosebnrock_plots/'
-    if not os.path.exists(savedir):
-        os.mkdir(savedir)
+    os.makedirs(savedir, exist_ok=True)
     for i, p in enumerate(p_range):
         for j, a in enumerate(a_range):
             a = numpy.around(a, 1).tolist()
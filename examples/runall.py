@@ -1,25 +1,196 @@
+import argparse
+import contextlib
+import gc
+import glob
+import io
+import multiprocessing
 import os
+import random
+import runpy
+import shutil
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 base = os.path.dirname(os.path.abspath(__file__))
 
 failed_examples = []
 
 
+def clean_up():
+    """
+    Remove the files generated by the example scripts from the working directory in this process instead of a
+    forked shell.
+    """
+    for path in glob.glob('*.png') + glob.glob('test*') + ['mlruns']:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+@contextlib.contextmanager
+def global_state():
+    """
+    Restore the process-global state an example script may change, so the next script run in this interpreter
+    starts from the same state as in a fresh process: matmul precision, default dtype, number of threads,
+    grad mode, deterministic algorithms, random number generators and matplotlib interactive mode.
+    Persistent DataLoader workers of the script are shut down by collecting its unreferenced loaders.
+    """
+    import matplotlib
+    import numpy as np
+    import torch
+    precision, dtype = torch.get_float32_matmul_precision(), torch.get_default_dtype()
+    threads, grad = torch.get_num_threads(), torch.is_grad_enabled()
+    deterministic = torch.are_deterministic_algorithms_enabled()
+    rng = random.getstate(), np.random.get_state(), torch.random.get_rng_state()
+    cuda_rng = torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None
+    interactive = matplotlib.is_interactive()
+    try:
+        yield
+    finally:
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
+        matplotlib.interactive(interactive)
+        torch.set_float32_matmul_precision(precision)
+        torch.set_default_dtype(dtype)
+        torch.set_num_threads(threads)
+        torch.set_grad_enabled(grad)
+        torch.use_deterministic_algorithms(deterministic)
+        random.setstate(rng[0])
+        np.random.set_state(rng[1])
+        torch.random.set_rng_state(rng[2])
+        if cuda_rng is not None:
+            torch.cuda.set_rng_state_all(cuda_rng)
+        gc.collect()
+
+
+def run_example(path, out=None):
+    """
+    Run an example script as __main__ in this interpreter, so the torch import and device context
+    are set up once for all examples instead of once per spawned python process. The process-global state
+    changed by the script is restored afterwards, see global_state. As with python path/to/script.py, the folder
+    of the script is put first on sys.path, and the modules the script imported from it are dropped afterwards.
+
+    :param path: (str) Path to the example script
+    :param out: (file-like) Destination of the script's stdout, appended to results.txt if None
+    :return: (int) Exit status, 0 on success
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    argv, syspath, modules = sys.argv, list(sys.path), set(sys.modules)
+    sys.argv = [path]
+    sys.path.insert(0, folder)
+    with global_state():
+        try:
+            with open('results.txt', 'a') if out is None else contextlib.nullcontext(out) as out, \
+                    contextlib.redirect_stdout(out):
+                runpy.run_path(path, run_name='__main__')
+            status = 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.argv = argv
+            sys.path[:] = syspath
+            for name in set(sys.modules) - modules:
+                file = getattr(sys.modules[name], '__file__', None)
+                if file and os.path.dirname(os.path.abspath(file)) == folder:
+                    del sys.modules[name]
+    return status
+
+
 def run(path, failed_examples=failed_examples):
     print(f'Running example scripts in folder {path}')
     dirs = [k for k in os.listdir(path) if os.path.isdir(k) if k!= 'mlruns' and k != 'figs']
     files = [k for k in os.listdir(path) if k.endswith('.py') and k != 'runall.py']
     for f in files:
-        status = os.system(f'python {os.path.join(path, f)} >> results.txt')
+        status = run_example(os.path.join(path, f))
         print(f'{f} exited with status={status}')
         if status !=0:
             failed_examples += [f]
-        os.system('rm -rf *.png; rm -rf test*; rm -rf mlruns; rm -rf *.png')
+        clean_up()
     for d in dirs:
         failed_examples += run(os.path.join(path, d), failed_examples)
     return failed_examples
 
 
+def example_files(path):
+    """
+    :param path: (str) Folder of example scripts
+    :return: (list of str) Paths of the example scripts in the folder and its subfolders
+    """
+    files = [os.path.join(path, k) for k in sorted(os.listdir(path)) if k.endswith('.py') and k != 'runall.py']
+    for d in sorted(os.listdir(path)):
+        if os.path.isdir(os.path.join(path, d)) and d not in ('mlruns', 'figs', '__pycache__'):
+            files += example_files(os.path.join(path, d))
+    return files
+
+
+def init_worker(workers):
+    import torch
+    # the small example models share one GPU, each worker may only take its share of the memory
+    if torch.cuda.is_available():
+        torch.cuda.set_per_process_memory_fraction(1.0 / workers)
+
+
+def run_captured(path):
+    """
+    Run an example script in its own temporary working directory, so concurrent scripts do not write to the same
+    logger savedirs, mlruns and figures. The data files of the script folder, e.g. boxes.pkl, are copied into the
+    directory rather than linked, so a script overwriting them cannot change the repository. The directory and the
+    files generated in it are removed afterwards. The script folder is put on sys.path by run_example.
+
+    :param path: (str) Absolute path to the example script
+    :return: (int, str) Exit status and stdout of the script
+    """
+    out = io.StringIO()
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='runall-')
+    folder = os.path.dirname(os.path.abspath(path))
+    for k in os.listdir(folder):
+        if os.path.isfile(os.path.join(folder, k)) and not k.endswith('.py'):
+            shutil.copy2(os.path.join(folder, k), workdir)
+    os.chdir(workdir)
+    try:
+        return run_example(path, out=out), out.getvalue()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_parallel(path, workers):
+    """
+    Run the example scripts concurrently in a pool of worker processes. Each worker pays for the torch import and
+    CUDA context once. The script outputs are collected by this process and appended to results.txt in order.
+    Each script runs in its own temporary working directory, see run_captured.
+
+    :param path: (str) Folder of example scripts
+    :param workers: (int) Number of worker processes
+    :return: (list of str) Names of the failed example scripts
+    """
+    failed = []
+    files = example_files(path)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(workers,)) as pool, \
+            open('results.txt', 'a') as results:
+        for f, (status, output) in zip(files, pool.map(run_captured, files)):
+            results.write(output)
+            print(f'{os.path.basename(f)} exited with status={status}')
+            if status != 0:
+                failed += [os.path.basename(f)]
+    return failed
+
+
 if __name__ == '__main__':
-    failed_examples = []
-    failed_examples = run(base, failed_examples=failed_examples)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of example scripts run concurrently, 1 runs them one after another')
+    args = parser.parse_args()
+    if args.workers > 1:
+        failed_examples = run_parallel(base, args.workers)
+    else:
+        failed_examples = []
+        failed_examples = run(base, failed_examples=failed_examples)
     print(set(failed_examples))
@@ -90,7 +90,8 @@ problem.plot_graph()
 problem = problem.to(device)
 
 # %% trainer class
-optimizer = torch.optim.Adam(problem.parameters(), lr=0.1)
+fused = device.startswith("cuda")
+optimizer = torch.optim.Adam(problem.parameters(), lr=0.1, fused=fused, foreach=not fused)
 logger = BasicLogger(args=None, savedir='test', verbosity=1,
                      stdout="nstep_dev_"+reference_loss.output_keys[0])
 trainer = Trainer(
@@ -183,7 +183,8 @@ if __name__ == "__main__":
     interp_u = lambda tq, t, u: u
     integrator = integrators.DiffEqIntegrator(fx, h=args.ts, interp_u=interp_u)
     ssm = SSMIntegrator(integrator, nsteps=args.nsteps)
-    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9))
+    fused = next(ssm.parameters()).is_cuda
+    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9), fused=fused, foreach=not fused)
     validator = Validator(ssm, sys, box)
     callback = TSCallback(validator, args.logdir, figname='test/lorenz_control_node_diffeq_curriculum.png')
     objective = Loss(['X', 'X_ssm'], F.mse_loss, weight=args.q_mse, name='mse')
@@ -19,17 +19,30 @@ from neuromancer.component import Component
 from neuromancer.blocks import MLP
 from neuromancer.activations import activations
 from neuromancer.dataset import DictDataset
-from lorenz_node_curriculum import TSCallback, truncated_mse
+from lorenz_node_curriculum import TSCallback
 from neuromancer.loss import PenaltyLoss
 
 
-def get_x0(box):
+def get_x0(box, n=None):
     """
-    Randomly sample an initial condition
+    Randomly sample an initial condition, or n of them in a single vectorized draw
 
     :param box: Dictionary with keys 'min' and 'max' and values np.arrays with shape=(nx,)
+    :param n: (int) Number of initial conditions to sample, returns shape=(n, nx) instead of shape=(nx,)
     """
-    return np.random.uniform(low=box['min'], high=box['max'])
+    size = None if n is None else (n, len(box['min']))
+    return np.random.uniform(low=box['min'], high=box['max'], size=size)
+
+
+def truncated_mse(true, pred):
+    """
+    Squared errors capped at 1.0, averaged per trajectory
+
+    :param true: (torch.Tensor, shape=(nsamples, nsteps, nx))
+    :param pred: (torch.Tensor, shape=(nsamples, nsteps, nx))
+    :return: (torch.Tensor, shape=(nsamples,))
+    """
+    return (true - pred).pow(2).clamp(max=1.0).mean(dim=(1, 2))
 
 
 def get_box(system, ts, nsim):
@@ -55,14 +68,19 @@ class Validator:
         :param sys: (psl.ODE_NonAutonomous) Ground truth ODE system
         :param box: (dict) Dictionary with 'min', 'max' keys and np.array values for sampling initial conditions
         """
-        self.x0s = [get_x0(box) for i in range(10)]
-        X, U = [], []
-        for x0 in self.x0s:
-            sim = sys.simulate(ts=args.ts, nsim=1000, x0=x0, U=sys.get_U(1000))
-            X.append(sim['X'][:-1, :]), U.append(sim['U'])
-
-        self.reals = {'X': torch.tensor(np.stack(X), dtype=torch.float32),
-                      'U': torch.tensor(np.stack(U), dtype=torch.float32)}
+        self.x0s = get_x0(box, n=10)
+        nsim = 1000
+        X, U = np.empty((len(self.x0s), nsim, len(box['min'])), dtype=np.float32), None
+        for i, x0 in enumerate(self.x0s):
+            sim = sys.simulate(ts=args.ts, nsim=nsim, x0=x0, U=sys.get_U(nsim))
+            if U is None:
+                U = np.empty((len(self.x0s), *sim['U'].shape), dtype=np.float32)
+            X[i], U[i] = sim['X'][:-1, :], sim['U']
+
+        # reference trajectories live on the model's device for the whole run
+        device = next(netG.parameters()).device
+        self.reals = {'X': torch.as_tensor(X, device=device),
+                      'U': torch.as_tensor(U, device=device)}
         self.netG = netG
 
     def __call__(self):
@@ -70,49 +88,69 @@ class Validator:
         self.netG.nsteps = 1000
         with torch.no_grad():
             simulation = self.netG.forward(self.reals)
-            simulation = np.nan_to_num(simulation['X_ssm'].detach().numpy(),
-                                       copy=True, nan=200000., posinf=None, neginf=None)
-            mses = ((self.reals['X'] - simulation)**2).mean(axis=(1, 2))
+            simulation = torch.nan_to_num(simulation['X_ssm'], nan=200000.)
+            mses = (self.reals['X'] - simulation).pow(2).mean(dim=(1, 2))
             truncs = truncated_mse(self.reals['X'], simulation)
-        best = np.argmax(truncs)
+        best = torch.argmax(truncs)
         self.netG.nsteps = nsteps
-        return truncs.mean(), mses.mean(), simulation[best], self.reals['X'][best]
+        return truncs.mean(), mses.mean(), simulation[best].cpu().numpy(), self.reals['X'][best].cpu().numpy()
 
 
-def get_data(nsteps, box, sys):
+def loader_kwargs(device):
     """
-    :param nsteps: (int) Number of timesteps for each batch of training data
-    :param box: (dict) Dictionary with 'min', 'max' keys and np.array values for sampling initial conditions
+    DataLoader settings that keep worker processes alive across epochs and prefetch batches in the background.
+
+    :param device: (torch.device) Device the batches are trained on, pinned host memory is only useful for cuda
+    """
+    num_workers = (os.cpu_count() or 0) // 2
+    kwargs = {'num_workers': num_workers, 'pin_memory': device.type == 'cuda'}
+    if num_workers > 0:
+        kwargs.update(prefetch_factor=2, persistent_workers=True)
+    return kwargs
+
+
+def get_trajectory(sys, box, max_nsteps):
+    """
+    Simulate one long trajectory that every curriculum stage slices its training data from
+
     :param sys: (psl.ODE_NonAutonomous)
+    :param box: (dict) Dictionary with 'min', 'max' keys and np.array values for sampling initial conditions
+    :param max_nsteps: (int) Longest rollout horizon the trajectory needs to cover
+    :return: (np.array shape=(length, nx), np.array shape=(length, nu))
+    """
+    length = args.nsim*max_nsteps + max_nsteps
+    sim = sys.simulate(ts=args.ts, nsim=length, x0=get_x0(box), U=sys.get_U(length))
+    return sim['X'][:length], sim['U'][:length]
+
+
+def get_data(nsteps, trajectory):
+    """
+    :param nsteps: (int) Number of timesteps for each batch of training data
+    :param trajectory: (tuple) States and inputs of a simulation from get_trajectory at least args.nsim*nsteps + nsteps long
 
     """
-    X, R, T, U = [], [], [], []
-    for _ in range(args.nsim):
-        sim = sys.simulate(ts=args.ts, nsim=nsteps, x0=get_x0(box), U=sys.get_U(nsteps))
-        # this will have the same starting point as the last state in sim but will be 1 timestep longer and you
-        # throw away the first state.
-        X.append(sim['X'][:-1, :])
-        U.append(sim['U'])
-                
-    X, U = np.stack(X), np.stack(U)
-    sim = sys.simulate(ts=args.ts, nsim=args.nsim*nsteps, x0=get_x0(box), U=sys.get_U(args.nsim*nsteps))
-
-    sim['Y'] = sim['Y'][:-1, :]
-    sim['X'] = sim['X'][:-1, :]
-
-    nx, nu = X.shape[-1], U.shape[-1]
-    x, u  = sim['X'].reshape(args.nsim, nsteps, nx), sim['U'].reshape(args.nsim, nsteps, nu)
-    X, U = np.concatenate([X, x], axis=0), np.concatenate([U, u], axis=0)
-
-    train_data = DictDataset({'X': torch.Tensor(X, device=device),
-                              'U': torch.Tensor(U, device=device)}, name='train')
+    # windows starting at random offsets stand in for trajectories from random initial conditions,
+    # the aligned chunks give the contiguous rollouts
+    length = args.nsim*nsteps + nsteps
+    sim_x, sim_u = trajectory[0][:length], trajectory[1][:length]
+    nx, nu = sim_x.shape[-1], sim_u.shape[-1]
+
+    rand_idx = np.random.randint(0, length - nsteps + 1, size=args.nsim)
+    x_windows = np.lib.stride_tricks.sliding_window_view(sim_x, (nsteps, nx)).reshape(-1, nsteps, nx)
+    u_windows = np.lib.stride_tricks.sliding_window_view(sim_u, (nsteps, nu)).reshape(-1, nsteps, nu)
+    x, u = sim_x[:args.nsim*nsteps].reshape(args.nsim, nsteps, nx), sim_u[:args.nsim*nsteps].reshape(args.nsim, nsteps, nu)
+    X, U = np.concatenate([x_windows[rand_idx], x], axis=0), np.concatenate([u_windows[rand_idx], u], axis=0)
+
+    # keep data on the host, pinned loader batches are copied to device asynchronously by the trainer
+    X = torch.from_numpy(np.ascontiguousarray(X)).float()
+    U = torch.from_numpy(np.ascontiguousarray(U)).float()
+    train_data = DictDataset({'X': X, 'U': U}, name='train')
     train_loader = DataLoader(train_data, batch_size=args.batch_size,
-                              collate_fn=train_data.collate_fn, shuffle=True)
+                              collate_fn=train_data.collate_fn, shuffle=True, **loader_kwargs(device))
 
-    dev_data = DictDataset({'X': torch.Tensor(X[0:1], device=device),
-                            'U': torch.Tensor(U[0:1], device=device)}, name='dev')
-    dev_loader = DataLoader(dev_data, num_workers=1, batch_size=args.batch_size,
-                            collate_fn=dev_data.collate_fn, shuffle=False)
+    dev_data = DictDataset({'X': X[0:1], 'U': U[0:1]}, name='dev')
+    dev_loader = DataLoader(dev_data, batch_size=args.batch_size,
+                            collate_fn=dev_data.collate_fn, shuffle=False, **loader_kwargs(device))
     test_loader = dev_loader
     return nx, nu, train_loader, dev_loader, test_loader
 
@@ -137,12 +175,19 @@ class SSMIntegrator(Component):
         """
         
         x = data['X'][:, 0, :]
-        U = data['U']
-        X = [x]
+        # time-major layout so every step reads and writes one contiguous (nsamples, n) block
+        U = data['U'].transpose(0, 1).contiguous()
+        X = torch.empty((self.nsteps, U.shape[1], x.shape[-1]), dtype=x.dtype, device=x.device)
+        X[0] = x
+        if not torch.is_grad_enabled():
+            # without autograd the buffer can be read back in place, so each step's output is freed right after the copy
+            for i in range(self.nsteps - 1):
+                X[i + 1] = self.integrator(X[i], u=U[i])
+            return {'X_ssm': X.transpose(0, 1)}
         for i in range(self.nsteps - 1):
-            x = self.integrator(x, u=U[:, i, :])
-            X.append(x)
-        return {'X_ssm': torch.stack(X, dim=1)}
+            x = self.integrator(x, u=U[i])
+            X[i + 1] = x
+        return {'X_ssm': X.transpose(0, 1)}
 
 
 if __name__ == "__main__":
@@ -167,24 +212,34 @@ if __name__ == "__main__":
            help="Some name to tell what the experiment run was about.")
     parser.add_argument('-hsize', type=int, default=128, help='Size of hiddens states')
     parser.add_argument('-nlayers', type=int, default=4, help='Number of hidden layers for MLP')
+    parser.add_argument('-amp', action='store_true', help='Train with float16 autocast on tensor core GPUs')
+    parser.add_argument('-bf16', action='store_true', help='Use bfloat16 instead of float16 for -amp')
 
     args = parser.parse_args()
     device = torch.device('cuda:0' if torch.cuda.is_available() else "cpu")
+    # allow TF32 tensor core GEMMs for the float32 MLP on Ampere and newer GPUs
+    torch.set_float32_matmul_precision('high')
     os.makedirs(args.logdir, exist_ok=True)
 
     sys = psl.nonautonomous.systems[args.system]()
     box = get_box(sys, args.ts, 1000)
-    nx, nu, train_data, dev_data, test_data = get_data(args.nsteps, box, sys)
+    # the curriculum doubles nsteps after each of its 5 stages
+    trajectory = get_trajectory(sys, box, args.nsteps * 2**5)
+    nx, nu, train_data, dev_data, test_data = get_data(args.nsteps, trajectory)
     fx = MLP(nx+nu, nx, bias=False, linear_map=nn.Linear, nonlin=activations['elu'], hsizes=[args.hsize for h in range(args.nlayers)])
     interp_u = lambda tq, t, u: u
     integrator = integrators[args.stepper](fx, h=args.ts, interp_u=interp_u)
-    ssm = SSMIntegrator(integrator, nsteps=args.nsteps)
-    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9))
+    ssm = SSMIntegrator(integrator, nsteps=args.nsteps).to(device)
+    fused = device.type == 'cuda'
+    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9), fused=fused, foreach=not fused)
     validator = Validator(ssm, sys, box)
     callback = TSCallback(validator, args.logdir, figname='test/lorenz_control_node_curriculum.png')
     objective = Loss(['X', 'X_ssm'], F.mse_loss, weight=args.q_mse, name='mse')
     loss = PenaltyLoss([objective], [])
     problem = Problem([ssm], loss)
+    # compile in place so state_dict keys and saved artifacts match the uncompiled problem.
+    # dynamic=False specializes on ssm.nsteps, so each curriculum stage gets its own fully unrolled rollout graph
+    problem.compile(dynamic=False)
     logger = MLFlowLogger(args, savedir=args.logdir, stdout=['train_mse', 'eval_mse', 'eval_tmse'])
     trainer = Trainer(problem, train_data, dev_data, test_data, opt, logger,
                                   callback=callback,
@@ -193,7 +248,9 @@ if __name__ == "__main__":
                       train_metric='train_mse',
                       dev_metric='dev_mse',
                       test_metric='test_mse',
-                      eval_metric='eval_tmse')
+                      eval_metric='eval_tmse',
+                      device=device,
+                      amp=args.amp, amp_dtype=torch.bfloat16 if args.bf16 else torch.float16)
 
     lr = args.lr
     nsteps = args.nsteps
@@ -202,7 +259,7 @@ if __name__ == "__main__":
         trainer.train()
         lr/= 2.0
         nsteps *= 2
-        nx, nu, train_data, dev_data, test_data = get_data(nsteps, box, sys)
+        nx, nu, train_data, dev_data, test_data = get_data(nsteps, trajectory)
         trainer.train_data, trainer.dev_data, trainer.test_data = train_data, dev_data, test_data
         ssm.nsteps = nsteps
         opt.param_groups[0]['lr'] = lr
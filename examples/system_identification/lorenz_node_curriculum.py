@@ -177,7 +177,8 @@ if __name__ == "__main__":
     fx = MLP(nx, nx, bias=False, linear_map=nn.Linear, nonlin=activations['elu'], hsizes=[128, 128, 128, 128])
     integrator = integrators[args.stepper](fx, h=args.ts)
     ssm = SSMIntegrator(integrator, nsteps=args.nsteps)
-    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9))
+    fused = next(ssm.parameters()).is_cuda
+    opt = optim.Adam(ssm.parameters(), args.lr, betas=(0.0, 0.9), fused=fused, foreach=not fused)
     validator = Validator(ssm, modelSystem)
     callback = TSCallback(validator, args.logdir)
     objective = Loss(['X', 'X_ssm'], F.mse_loss, weight=args.q_mse, name='mse')
@@ -26,6 +26,7 @@ More detailed description of options in the `get_base_parser()` function in comm
 """
 
 import torch
+import torch.nn.functional as F
 import slim
 import psl
 import numpy as np
@@ -38,7 +39,7 @@ from neuromancer.problem import Problem
 from neuromancer.dataset import get_sequence_dataloaders
 from neuromancer.loss import get_loss
 from neuromancer.loggers import BasicLogger, MLFlowLogger
-from neuromancer.constraint import variable
+from neuromancer.constraint import variable, Loss
 import neuromancer.simulator as sim
 
 
@@ -131,6 +132,15 @@ def arg_sys_id_problem(prefix='', system='aero'):
            help="Whether to run simulator during evaluation phase of training.")
     gp.add("-seed", type=int, default=408, help="Random seed used for weight initialization.")
     gp.add("-gpu", type=int, help="GPU to use")
+    gp.add("-compile", type=str, default=None, choices=["default", "reduce-overhead", "max-autotune"],
+           help="torch.compile mode for the state space model rollout and MLP state estimators. Shapes are fixed by "
+                "nsteps and the batch size, so reduce-overhead can replay the whole rollout as a CUDA graph.")
+    gp.add("-amp", type=str, default=None, choices=["float16", "bfloat16"],
+           help="Train with autocast mixed precision in this dtype. float16 adds gradient scaling and needs a CUDA "
+                "device with tensor cores, the dev metric used for model selection stays float32.")
+    gp.add("-checkpoint", action="store_true",
+           help="Recompute the state space model rollout in sqrt(nsteps) gradient checkpointed segments in the backward "
+                "pass instead of storing the activations of every step.")
     gp.add("-loss", type=str, default='penalty',
            choices=['penalty', 'barrier'],
            help="type of the loss function.")
@@ -163,6 +173,8 @@ def get_model_components(args, dims, estim_name="estim", dynamics_name="dynamics
         "residual_mlp": blocks.ResMLP,
     }[args.nonlinear_map]
 
+    # the MLP estimators are compiled with the rollout, on CPU this removes the per layer interpreter overhead
+    estimator_kwargs = {"compiled": args.compile} if args.state_estimator in ("mlp", "residual_mlp") else {}
     estimator = {
         "linear": estimators.LinearEstimator,
         "mlp": estimators.MLPEstimator,
@@ -180,6 +192,7 @@ def get_model_components(args, dims, estim_name="estim", dynamics_name="dynamics
         input_keys=["Yp"],
         linargs=linargs,
         name=estim_name,
+        **estimator_kwargs,
     )
 
     dynamics_model = (
@@ -192,7 +205,9 @@ def get_model_components(args, dims, estim_name="estim", dynamics_name="dynamics
             activation=activation,
             name=dynamics_name,
             input_key_map={"x0": f"x0_{estimator.name}"},
-            linargs=linargs
+            linargs=linargs,
+            compiled=args.compile,
+            checkpoint_segments=args.checkpoint,
         ) if args.ssm_type == "blackbox"
         else dynamics.block_model(
             args.ssm_type,
@@ -204,7 +219,9 @@ def get_model_components(args, dims, estim_name="estim", dynamics_name="dynamics
             activation=activation,
             name=dynamics_name,
             input_key_map={"x0": f"x0_{estimator.name}"},
-            linargs=linargs
+            linargs=linargs,
+            compiled=args.compile,
+            checkpoint_segments=args.checkpoint,
         )
     )
     return estimator, dynamics_model
@@ -219,22 +236,23 @@ def get_objective_terms(args, dims, estimator, dynamics_model):
     xhat = variable(f"X_pred_{dynamics_model.name}")
     state_smoothing = args.Q_dx*((xhat[:, 1:, :] == xhat[:,:-1, :])^2)
 
-    est_reg = variable(f"reg_error_{estimator.name}")
-    dyn_reg = variable(f"reg_error_{dynamics_model.name}")
-    regularization = args.Q_sub*((est_reg + dyn_reg == 0)^2)
+    def reference_regularization_loss(yhat, y, est_reg, dyn_reg):
+        # tracking error and component regularization in one term instead of two separately dispatched objectives.
+        # Q_y scales the mean in place and Q_sub is folded into the sum, the regularization errors are 0-d tensors
+        return torch.add(F.mse_loss(yhat, y).mul_(args.Q_y), (est_reg + dyn_reg).square(), alpha=args.Q_sub)
 
     yhat = variable(f"Y_pred_{dynamics_model.name}")
-    y = variable("Yf")
-    reference_loss = args.Q_y*((yhat == y)^2)
+    reference_loss = Loss([yhat.key, "Yf", f"reg_error_{estimator.name}", f"reg_error_{dynamics_model.name}"],
+                          reference_regularization_loss, name="ref_reg_loss")
 
-    observation_lower_bound_penalty = args.Q_con_x*(yhat > xmin)
-    observation_upper_bound_penalty = args.Q_con_x*(yhat < xmax)
+    # xmin < yhat < xmax as a single box constraint |yhat - center| < radius: the same penalty as separate
+    # lower and upper bounds since at most one of them is violated, but with one pass over the predictions
+    observation_bounds_penalty = args.Q_con_x*(abs(yhat - (xmin + xmax)/2) < (xmax - xmin)/2)
 
-    objectives = [reference_loss, regularization]
+    objectives = [reference_loss]
     constraints = [
         state_smoothing,
-        observation_lower_bound_penalty,
-        observation_upper_bound_penalty,
+        observation_bounds_penalty,
     ]
 
     if args.ssm_type != "blackbox":
@@ -258,6 +276,8 @@ if __name__ == "__main__":
     parser = arg.ArgParser(parents=[arg_sys_id_problem(system='TwoTank')])
     args, grps = parser.parse_arg_groups()
     device = f"cuda:{args.gpu}" if args.gpu is not None else "cpu"
+    # allow TF32 tensor core GEMMs for the float32 linear maps of the estimator and the SSM on Ampere and newer GPUs
+    torch.set_float32_matmul_precision('high')
     torch.manual_seed(args.data_seed)
     # instantiate logger for managing experiment verbosity and results logging
     log_constructor = MLFlowLogger if args.logger == 'mlflow' else BasicLogger
@@ -278,7 +298,9 @@ if __name__ == "__main__":
     plt.interactive(True)
 
     # create torch dataloader for a sequential data
-    nstep_data, loop_data, dims = get_sequence_dataloaders(raw, args.nsteps, norm_type=None)
+    # batches staged in pinned memory are copied to the GPU asynchronously by the trainer
+    nstep_data, loop_data, dims = get_sequence_dataloaders(raw, args.nsteps, norm_type=None,
+                                                           dataloader_kwargs={"pin_memory": device.startswith("cuda")})
     train_data, dev_data, test_data = nstep_data
     train_loop, dev_loop, test_loop = loop_data
 
@@ -300,7 +322,9 @@ if __name__ == "__main__":
     plt.show(block=True)
 
     # select optimizer
-    optimizer = torch.optim.AdamW(problem.parameters(), lr=args.lr)
+    #   fused kernels update all parameters at once on GPU, foreach batches the per-tensor loop on CPU
+    fused = device.startswith("cuda")
+    optimizer = torch.optim.AdamW(problem.parameters(), lr=args.lr, fused=fused, foreach=not fused)
     # get trainer
     trainer = Trainer(
         problem,
@@ -317,6 +341,8 @@ if __name__ == "__main__":
         patience=args.patience,
         warmup=args.warmup,
         device=device,
+        amp=args.amp is not None,
+        amp_dtype=getattr(torch, args.amp or "float16"),
     )
     # train the model
     best_model = trainer.train()
@@ -92,7 +92,8 @@ problem.plot_graph()
 problem = problem.to(device)
 
 # %%
-optimizer = torch.optim.Adam(problem.parameters(), lr=0.001)
+fused = device.startswith("cuda")
+optimizer = torch.optim.Adam(problem.parameters(), lr=0.001, fused=fused, foreach=not fused)
 trainer = Trainer(
     problem,
     train_data,
@@ -57,16 +57,13 @@ ic_multistep = torch.from_numpy(traj_ref[:4, :]).reshape((4, 1,
 integrator_multistep = integrators.MultiStep_PredictorCorrector(ode_block,
  interp_u=None, h=ts)
 
-input_list = [ic_multistep]
-output_list = []
+# the trajectory is preallocated and each window of four states is a view into it
+traj = ic_multistep.new_empty((nsim + 4, 1, X.shape[1]))
+traj[:4] = ic_multistep
 for step in range(nsim):
-    output_list.append(integrator_multistep(input_list[step]))
-    new_input = torch.cat([input_list[step][1:, :, :],
-     output_list[step].unsqueeze(1)], dim=0)
-    input_list.append(new_input)
+    traj[step + 4] = integrator_multistep(traj[step:step + 4])
 
-traj_pred = torch.cat([ic_multistep.squeeze(1)] + output_list,
- dim = 0).squeeze(1).numpy() 
+traj_pred = traj.squeeze(1).numpy()
 err = np.linalg.norm(traj_pred[:-4, :] - traj_ref)/np.linalg.norm(traj_ref)
 
 print('multi-step auto err')
@@ -0,0 +1,68 @@
+"""
+Numba kernels for the Poly2 feature expansion on CPU. Each sample is expanded in a single pass
+over its features instead of gathering two index copies and concatenating the result.
+"""
+import numba
+import numpy as np
+import torch
+
+
+@numba.njit(parallel=True, cache=True, fastmath=True)
+def poly2_expand(x, out):
+    nsamples, n = x.shape
+    for b in numba.prange(nsamples):
+        k = n
+        for i in range(n):
+            xi = x[b, i]
+            out[b, i] = xi
+            for j in range(i, n):
+                out[b, k] = xi * x[b, j]
+                k += 1
+
+
+@numba.njit(parallel=True, cache=True, fastmath=True)
+def poly2_expand_backward(x, grad_out, grad_x):
+    nsamples, n = x.shape
+    for b in numba.prange(nsamples):
+        for i in range(n):
+            grad_x[b, i] = grad_out[b, i]
+        k = n
+        for i in range(n):
+            xi = x[b, i]
+            for j in range(i, n):
+                g = grad_out[b, k]
+                grad_x[b, i] += g * x[b, j]
+                grad_x[b, j] += g * xi
+                k += 1
+
+
+class Poly2Expand(torch.autograd.Function):
+    """
+    Differentiable wrapper of the numba kernels for 2-d CPU tensors of shape [batchsize, N].
+    The kernels run on numpy arrays, so torch.func transforms are not supported.
+    """
+
+    @staticmethod
+    def forward(x):
+        n = x.shape[-1]
+        out = torch.empty(x.shape[0], n + n * (n + 1) // 2, dtype=x.dtype)
+        poly2_expand(x.detach().contiguous().numpy(), out.numpy())
+        return out
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        x, = inputs
+        ctx.save_for_backward(x)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        x, = ctx.saved_tensors
+        n = x.shape[-1]
+        if torch.is_grad_enabled():
+            # double backward (create_graph=True) needs a differentiable gradient
+            rows, cols = torch.triu_indices(n, n, device=x.device)
+            grad_pairs = grad_out[:, n:]
+            return grad_out[:, :n].index_add(1, rows, grad_pairs * x[:, cols]).index_add(1, cols, grad_pairs * x[:, rows])
+        grad_x = torch.empty(x.shape, dtype=x.dtype)
+        poly2_expand_backward(x.detach().contiguous().numpy(), np.ascontiguousarray(grad_out.numpy()), grad_x.numpy())
+        return grad_x
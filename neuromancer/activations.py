@@ -13,6 +13,8 @@ def soft_exp(alpha, x):
     :param x: (torch.Tensor) Arbitrary shaped tensor input
     :return: (torch.Tensor) Result of the function applied elementwise on the tensor.
     """
+    if torch.compiler.is_compiling():
+        return _soft_exp_branchless(alpha, x)
     if alpha == 0.0:
         return x
     elif alpha < 0.0:
@@ -21,6 +23,20 @@ def soft_exp(alpha, x):
         return (torch.exp(alpha * x) - 1) / alpha + alpha
 
 
+def _soft_exp_branchless(alpha, x):
+    """
+    Same function as soft_exp with the branch on alpha replaced by elementwise selects, so torch.compile
+    can trace it without a graph break or a device to host sync and fuse it into a single kernel.
+    Unselected branches are evaluated at safe arguments to keep gradients finite.
+    """
+    alpha = torch.as_tensor(alpha, dtype=x.dtype, device=x.device)
+    neg, pos = alpha < 0.0, alpha > 0.0
+    safe_alpha = torch.where(neg | pos, alpha, torch.ones_like(alpha))
+    log = -torch.log(torch.where(neg, 1 - safe_alpha * (x + safe_alpha), torch.ones_like(x))) / safe_alpha
+    exp = (torch.exp(torch.where(pos, safe_alpha * x, torch.zeros_like(x))) - 1) / safe_alpha + safe_alpha
+    return torch.where(neg, log, torch.where(pos, exp, x))
+
+
 class SoftExponential(nn.Module):
     """
     Soft exponential activation: https://arxiv.org/pdf/1602.01321.pdf
@@ -217,9 +233,12 @@ class SmoothedReLU(nn.Module):
         self.d = nn.Parameter(torch.tensor(d), requires_grad=tune_d)
 
     def forward(self, x):
-        alpha = 1.0 / F.softplus(self.d)
-        beta = - F.softplus(self.d) / 2
-        return torch.max(torch.clamp(torch.sign(x) * torch.div(alpha, 2.0) * x ** 2, min=0, max=-beta.item()), x + beta)
+        width = F.softplus(self.d)
+        alpha = 1.0 / width
+        beta = - width / 2
+        # clamp against a detached tensor bound instead of beta.item() to avoid a device sync and graph break
+        quad = torch.minimum(torch.clamp(torch.sign(x) * torch.div(alpha, 2.0) * x ** 2, min=0), -beta.detach())
+        return torch.max(quad, x + beta)
 
 
 activations = {
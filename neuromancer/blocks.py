@@ -3,14 +3,62 @@ Function approximators of various degrees of generality which implement a consis
 Neural network module building blocks for neural state space models, state estimators and control policies.
 """
 
-import numpy as np
+import math
+
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 import slim
 
 import neuromancer.rnn as rnn
 from neuromancer.activations import SoftExponential, SmoothedReLU
 
+try:
+    from neuromancer._poly2_numba import Poly2Expand
+except ImportError:
+    Poly2Expand = None
+
+
+def sum_reg_errors(modules):
+    """
+    Sum the regularization errors of the modules that define one. 0-d tensor errors are reduced
+    with a single stacked sum instead of a chain of scalar additions.
+
+    :param modules: (iterable of nn.Module)
+    :return: (torch.Tensor or float)
+    """
+    errors = [m.reg_error() for m in modules if hasattr(m, "reg_error")]
+    if errors and all(isinstance(e, torch.Tensor) and e.dim() == 0 for e in errors):
+        return torch.stack(errors).sum()
+    return sum(errors)
+
+
+def segment_bounds(nlayers, nsegments=None):
+    """
+    Split a stack of layers into contiguous segments for activation checkpointing.
+
+    :param nlayers: (int) Number of layers
+    :param nsegments: (int) Number of segments, defaults to sqrt(nlayers)
+    :return: (tuple of (int, int)) Start and end layer index of each segment
+    """
+    nsegments = max(1, min(nlayers, nsegments or int(math.sqrt(nlayers))))
+    size = -(-nlayers // nsegments)
+    return tuple((start, min(start + size, nlayers)) for start in range(0, nlayers, size))
+
+
+def nonlin_factory(nonlin, linear_map):
+    """
+    The output of an unconstrained linear map is not saved for backward, so a ReLU applied directly to it
+    can overwrite it in place instead of allocating a new activation tensor.
+
+    :param nonlin: (callable) Constructor of the activation
+    :param linear_map: (class) Linear map class the activation is applied after
+    :return: (callable) Constructor of the activation
+    """
+    if nonlin is nn.ReLU and linear_map in (slim.Linear, nn.Linear):
+        return lambda: nn.ReLU(inplace=True)
+    return nonlin
+
 
 class Linear(nn.Module):
     """
@@ -96,6 +144,10 @@ class MLP(nn.Module):
         nonlin=SoftExponential,
         hsizes=[64],
         linargs=dict(),
+        compiled=False,
+        stacked=False,
+        checkpointed=False,
+        checkpoint_segments=None,
     ):
         """
 
@@ -106,22 +158,54 @@ class MLP(nn.Module):
         :param nonlin: (callable) Elementwise nonlinearity which takes as input torch.Tensor and outputs torch.Tensor of same shape
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
-        :param dropout: (float) Dropout probability
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
+        :param stacked: (bool) Store the hidden to hidden layers as one contiguous [nhidden-1, hsize, hsize] weight.
+                        Requires equal hidden sizes and an unconstrained linear map.
+        :param checkpointed: (bool) Recompute layer activations in the backward pass instead of storing them
+        :param checkpoint_segments: (int) Number of checkpointed segments, defaults to sqrt of the number of layers
         """
         super().__init__()
         self.in_features, self.out_features = insize, outsize
         self.nhidden = len(hsizes)
-        sizes = [insize] + hsizes + [outsize]
+        self.stacked = stacked and self.nhidden > 1
+        self.build_layers(insize, outsize, bias, linear_map, nonlin, hsizes, linargs)
+        assert not (self.stacked and checkpointed), "Stacked hidden layers can not be checkpointed"
+        self.checkpointed = checkpointed
+        self.segments = segment_bounds(len(self.linear), checkpoint_segments)
+        if compiled:
+            self.compile(dynamic=False)
+
+    def build_layers(self, insize, outsize, bias, linear_map, nonlin, hsizes, linargs):
+        """
+        Construct self.nonlin and self.linear. Subclasses with a different layer structure override this
+        so that the MLP layers are not allocated only to be replaced.
+        """
+        nonlin = nonlin_factory(nonlin, linear_map)
         self.nonlin = nn.ModuleList([nonlin() for k in range(self.nhidden)] + [nn.Identity()])
+        if self.stacked:
+            assert len(set(hsizes)) == 1, "All hidden sizes should be equal for stacked hidden layers"
+            assert linear_map in (slim.Linear, nn.Linear), "Only unconstrained linear maps can be stacked"
+            hidden = [nn.Linear(hsizes[0], hsizes[0], bias=bias) for k in range(self.nhidden - 1)]
+            # pre-transposed so the forward pass is a plain x @ W
+            self.weight = nn.Parameter(torch.stack([lin.weight.detach().T for lin in hidden]).contiguous())
+            self.bias = nn.Parameter(torch.stack([lin.bias.detach() for lin in hidden])) if bias else None
+            sizes = [insize, hsizes[0], outsize]
+        else:
+            sizes = [insize] + hsizes + [outsize]
         self.linear = nn.ModuleList(
             [
                 linear_map(sizes[k], sizes[k + 1], bias=bias, **linargs)
-                for k in range(self.nhidden + 1)
+                for k in range(len(sizes) - 1)
             ]
         )
 
     def reg_error(self):
-        return sum([k.reg_error() for k in self.linear if hasattr(k, "reg_error")])
+        return sum_reg_errors(self.linear)
+
+    def layers(self, x, start, end):
+        for lin, nlin in zip(self.linear[start:end], self.nonlin[start:end]):
+            x = nlin(lin(x))
+        return x
 
     def forward(self, x):
         """
@@ -129,6 +213,19 @@ class MLP(nn.Module):
         :param x: (torch.Tensor, shape=[batchsize, insize])
         :return: (torch.Tensor, shape=[batchsize, outsize])
         """
+        if self.checkpointed and torch.is_grad_enabled():
+            # the last segment is needed right away by backward so it is not worth recomputing
+            for start, end in self.segments[:-1]:
+                x = checkpoint(self.layers, x, start, end, use_reentrant=False)
+            return self.layers(x, *self.segments[-1])
+        if self.stacked:
+            x = self.nonlin[0](self.linear[0](x))
+            for k in range(self.nhidden - 1):
+                x = torch.matmul(x, self.weight[k])
+                if self.bias is not None:
+                    x = x + self.bias[k]
+                x = self.nonlin[k + 1](x)
+            return self.nonlin[-1](self.linear[-1](x))
         for lin, nlin in zip(self.linear, self.nonlin):
             x = nlin(lin(x))
         return x
@@ -163,6 +260,7 @@ class MLP_bounds(MLP):
         min=0.0,
         max=1.0,
         method='sigmoid_scale',
+        compiled=False,
     ):
         """
 
@@ -174,10 +272,11 @@ class MLP_bounds(MLP):
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
         :param dropout: (float) Dropout probability
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
         """
         super().__init__(insize=insize, outsize=outsize, bias=bias,
                          linear_map=linear_map, nonlin=nonlin,
-                         hsizes=hsizes, linargs=linargs)
+                         hsizes=hsizes, linargs=linargs, compiled=compiled)
         self.min = min
         self.max = max
         self.method = self._set_method(method)
@@ -217,6 +316,7 @@ class InteractionEmbeddingMLP(nn.Module):
         hsizes=[64],
         linargs=dict(),
         n_interactors=9,
+        compiled=False,
     ):
         """
 
@@ -227,37 +327,45 @@ class InteractionEmbeddingMLP(nn.Module):
         :param nonlin: (callable) Elementwise nonlinearity which takes as input torch.Tensor and outputs torch.Tensor of same shape
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
-        :param dropout: (float) Dropout probability
         :param n_interactors: (int) Number of interacting entity types number of interactions is n_interactors squared.
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
         """
         super().__init__()
         self.in_features, self.out_features = insize, outsize
         self.nhidden = len(hsizes)
         self.n_interactors = n_interactors
         em_sizes = [hsizes[0], *hsizes]
-        sizes = [insize] + hsizes
-        sizes = [size + em_size for size, em_size in zip(sizes, em_sizes)]
-        sizes += [outsize]
+        # each layer sees its input concatenated with that layer's embedding
+        in_sizes = [size + em_size for size, em_size in zip([insize] + hsizes, em_sizes)]
+        out_sizes = hsizes + [outsize]
         self.nonlin = nn.ModuleList([nonlin() for k in range(self.nhidden)] + [nn.Identity()])
-        self.embeddings = [nn.Embedding(int(n_interactors**2), n_embed) for n_embed in em_sizes]
+        # embeddings for all layers share one table so the lookup is a single gather, split per layer in forward
+        self.embeddings = nn.Embedding(int(n_interactors**2), sum(em_sizes))
+        self.em_sizes = em_sizes
         self.linear = nn.ModuleList(
             [
-                linear_map(sizes[k], sizes[k + 1], bias=bias, **linargs)
+                linear_map(in_sizes[k], out_sizes[k], bias=bias, **linargs)
                 for k in range(self.nhidden + 1)
             ]
         )
+        if compiled:
+            self.compile(dynamic=False)
 
     def reg_error(self):
-        return sum([k.reg_error() for k in self.linear if hasattr(k, "reg_error")])
+        return sum_reg_errors(self.linear)
 
     def forward(self, x, i, j):
         """
 
         :param x: (torch.Tensor, shape=[batchsize, insize])
+        :param i: (torch.LongTensor, shape=[] or [batchsize]) Interactor type of the first entity
+        :param j: (torch.LongTensor, shape=[] or [batchsize]) Interactor type of the second entity
         :return: (torch.Tensor, shape=[batchsize, outsize])
         """
-        for lin, nlin, embedder in zip(self.linear, self.nonlin, self.embeddings):
-            x = torch.cat([x, embedder(self.n_interactors*i + j)])
+        embeddings = self.embeddings(self.n_interactors*i + j).expand(*x.shape[:-1], -1)
+        embeddings = torch.split(embeddings, self.em_sizes, dim=-1)
+        for lin, nlin, em in zip(self.linear, self.nonlin, embeddings):
+            x = torch.cat([x, em], dim=-1)
             x = nlin(lin(x))
         return x
 
@@ -275,7 +383,10 @@ class MLPDropout(nn.Module):
         nonlin=SoftExponential,
         hsizes=[64],
         linargs=dict(),
-        dropout=0.0
+        dropout=0.0,
+        compiled=False,
+        at_train=False,
+        at_test=True,
     ):
         """
 
@@ -287,6 +398,9 @@ class MLPDropout(nn.Module):
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
         :param dropout: (float) Dropout probability
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
+        :param at_train: (bool) Enable dropout during training
+        :param at_test: (bool) Enable dropout during testing
         """
         super().__init__()
         self.in_features, self.out_features = insize, outsize
@@ -299,13 +413,13 @@ class MLPDropout(nn.Module):
                 for k in range(self.nhidden + 1)
             ]
         )
-        self.dropout = nn.ModuleList(
-            [Dropout(p=dropout) if dropout > 0.0 else nn.Identity() for _ in range(self.nhidden)]
-            + [nn.Identity()]
-        )
+        # one stateless Dropout is shared by the hidden layers, no dropout module at all when p == 0
+        self.dropout = Dropout(p=dropout, at_train=at_train, at_test=at_test) if dropout > 0.0 else None
+        if compiled:
+            self.compile(dynamic=False)
 
     def reg_error(self):
-        return sum([k.reg_error() for k in self.linear if hasattr(k, "reg_error")])
+        return sum_reg_errors(self.linear)
 
     def forward(self, x):
         """
@@ -313,9 +427,13 @@ class MLPDropout(nn.Module):
         :param x: (torch.Tensor, shape=[batchsize, insize])
         :return: (torch.Tensor, shape=[batchsize, outsize])
         """
-        for lin, nlin, drop in zip(self.linear, self.nonlin, self.dropout):
-            x = drop(nlin(lin(x)))
-        return x
+        if self.dropout is None:
+            for lin, nlin in zip(self.linear, self.nonlin):
+                x = nlin(lin(x))
+            return x
+        for lin, nlin in zip(self.linear[:-1], self.nonlin[:-1]):
+            x = self.dropout(nlin(lin(x)))
+        return self.nonlin[-1](self.linear[-1](x))
 
 
 class ResMLP(MLP):
@@ -332,6 +450,9 @@ class ResMLP(MLP):
         hsizes=[64],
         linargs=dict(),
         skip=1,
+        compiled=False,
+        checkpointed=False,
+        checkpoint_segments=None,
     ):
         """
 
@@ -342,6 +463,9 @@ class ResMLP(MLP):
         :param nonlin: (callable) Elementwise nonlinearity which takes as input torch.Tensor and outputs torch.Tensor of same shape
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
+        :param checkpointed: (bool) Recompute hidden layer activations in the backward pass instead of storing them
+        :param checkpoint_segments: (int) Number of checkpointed segments, defaults to sqrt of the number of hidden layers
         """
 
         super().__init__(
@@ -352,11 +476,16 @@ class ResMLP(MLP):
             nonlin=nonlin,
             hsizes=hsizes,
             linargs=linargs,
+            compiled=compiled,
+            checkpointed=checkpointed,
         )
         assert (
             len(set(hsizes)) == 1
         ), "All hidden sizes should be equal for residual network"
         self.skip = skip
+        # which hidden layers add the residual is fixed by skip, so decide it once instead of per forward pass
+        self.residual = tuple(layer % skip == 0 for layer in range(self.nhidden))
+        self.segments = segment_bounds(self.nhidden, checkpoint_segments)
         self.inmap = linear_map(insize, hsizes[0], bias=bias, **linargs)
         self.outmap = linear_map(hsizes[0], outsize, bias=bias, **linargs)
         self.in_features, self.out_features = insize, outsize
@@ -368,12 +497,21 @@ class ResMLP(MLP):
         :return: (torch.Tensor, shape=[batchsize, outsize])
         """
         px = self.inmap(x)
-        for layer, (lin, nlin) in enumerate(zip(self.linear[:-1], self.nonlin[:-1])):
-            x = nlin(lin(x))
-            if layer % self.skip == 0:
+        if self.checkpointed and torch.is_grad_enabled():
+            for start, end in self.segments[:-1]:
+                x, px = checkpoint(self.residual_layers, x, px, start, end, use_reentrant=False)
+            x, px = self.residual_layers(x, px, *self.segments[-1])
+        else:
+            x, px = self.residual_layers(x, px, 0, self.nhidden)
+        return self.linear[-1](x) + self.outmap(px)
+
+    def residual_layers(self, x, px, start, end):
+        for k in range(start, end):
+            x = self.nonlin[k](self.linear[k](x))
+            if self.residual[k]:
                 x = x + px
                 px = x
-        return self.linear[-1](x) + self.outmap(px)
+        return x, px
 
 
 class InputConvexNN(MLP):
@@ -393,8 +531,23 @@ class InputConvexNN(MLP):
                  linear_map=slim.Linear,
                  nonlin=nn.ReLU,
                  hsizes=[64],
-                 linargs=dict()
+                 linargs=dict(),
+                 compiled=False,
+                 stacked=False,
                  ):
+        """
+
+        :param insize: (int) dimensionality of input
+        :param outsize: (int) dimensionality of output
+        :param bias: (bool) Whether to use bias
+        :param linear_map: (class) Linear map class from slim.linear
+        :param nonlin: (callable) Elementwise nonlinearity which takes as input torch.Tensor and outputs torch.Tensor of same shape
+        :param hsizes: (list of ints) List of hidden layer sizes
+        :param linargs: (dict) Arguments for instantiating linear layer
+        :param compiled: (bool) Compile the forward pass with torch.compile so the layer loop is fused
+        :param stacked: (bool) Compute the input passthrough terms Wi(x) of all layers with one linear map ahead of the loop.
+                        Requires an unconstrained linear map.
+        """
         super().__init__(
             insize,
             outsize,
@@ -403,35 +556,49 @@ class InputConvexNN(MLP):
             nonlin=nonlin,
             hsizes=hsizes,
             linargs=linargs,
-
+            compiled=compiled,
+            stacked=stacked,
         )
+
+    def build_layers(self, insize, outsize, bias, linear_map, nonlin, hsizes, linargs):
         assert (
                 len(set(hsizes)) == 1
         ), "All hidden sizes should be equal for residual network"
 
         sizes = hsizes + [outsize]
-        self.linear = nn.ModuleList(
-            [
-                linear_map(insize, sizes[k + 1], bias=bias, **linargs)
-                for k in range(self.nhidden)
-            ]
-        )
+        # every activation input is either a fresh sum ux + px or the output of inmap
+        nonlin = nonlin_factory(nonlin, linear_map)
+        self.nonlin = nn.ModuleList([nonlin() for k in range(self.nhidden + 1)])
+        if self.stacked:
+            assert linear_map in (slim.Linear, nn.Linear), "Only unconstrained linear maps can be stacked"
+            self.split_sizes = sizes[1:]
+            self.linear = nn.ModuleList([linear_map(insize, sum(self.split_sizes), bias=bias, **linargs)])
+        else:
+            self.linear = nn.ModuleList(
+                [
+                    linear_map(insize, sizes[k + 1], bias=bias, **linargs)
+                    for k in range(self.nhidden)
+                ]
+            )
         self.poslinear = nn.ModuleList(
             [
                 slim.NonNegativeLinear(sizes[k], sizes[k + 1], bias=False, **linargs)
                 for k in range(self.nhidden)
             ]
         )
-        self.nonlin = nn.ModuleList([nonlin() for k in range(self.nhidden + 1)])
-
         self.inmap = linear_map(insize, hsizes[0], bias=bias, **linargs)
-        self.in_features, self.out_features = insize, outsize
 
     def forward(self, x):
         xi = x
         px = self.inmap(xi)
         x = self.nonlin[0](px)
-        for layer, (linU, nlin, linW) in enumerate(zip(self.poslinear, self.nonlin[1:], self.linear)):
+        if self.stacked:
+            # Wi(x) does not depend on the previous layer so all of them come from a single matmul
+            pxs = self.linear[0](xi).split(self.split_sizes, dim=-1)
+            for linU, nlin, px in zip(self.poslinear, self.nonlin[1:], pxs):
+                x = nlin(linU(x) + px)
+            return x
+        for linU, nlin, linW in zip(self.poslinear, self.nonlin[1:], self.linear):
             px = linW(xi)
             ux = linU(x)
             x = nlin(ux + px)
@@ -455,15 +622,47 @@ class PosDef(nn.Module):
         self.g = g
         self.in_features = self.g.in_features
         self.out_features = self.g.out_features
-        self.zero = torch.nn.Parameter(torch.zeros(1, self.g.in_features), requires_grad=False)
+        # the origin is a constant: a buffer moves with the module but is not handed to optimizers
+        self.register_buffer('zero', torch.zeros(1, self.g.in_features))
         self.eps = eps
         self.d = d
         self.smReLU = SmoothedReLU(self.d)
         self.max = max
+        self._g_zero_cache = None
+        self._g_zero_key = None
+
+    def train(self, mode=True):
+        self._g_zero_cache = None
+        return super().train(mode)
+
+    def _apply(self, fn, *args, **kwargs):
+        # device and dtype conversions replace the tensors of g, the cached value is recomputed from the new ones
+        self._g_zero_cache = None
+        return super()._apply(fn, *args, **kwargs)
+
+    def g_zero(self):
+        """
+        Value of g at the origin. In eval mode it only depends on the parameters of g,
+        so it is cached (detached) and recomputed when any parameter is updated in place.
+
+        :return: (torch.Tensor, shape=[1, outsize])
+        """
+        if self.training:
+            return self.g(self.zero)
+        key = tuple(p._version for p in self.g.parameters())
+        if self._g_zero_cache is None or key != self._g_zero_key:
+            with torch.no_grad():
+                self._g_zero_cache = self.g(self.zero)
+            self._g_zero_key = key
+        return self._g_zero_cache
 
     def forward(self, x):
-        shift_to_zero = self.smReLU(self.g(x) - self.g(self.zero))
-        quad_psd = self.eps*(x**2).sum(1, keepdim=True)
+        shift_to_zero = self.smReLU(self.g(x) - self.g_zero())
+        # the quadratic term keeps V positive definite near the origin, so half precision inputs are upcast to
+        # float32 under autocast, other dtypes are kept
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            xq = x.float() if x.dtype in (torch.float16, torch.bfloat16) else x
+            quad_psd = self.eps*(xq**2).sum(1, keepdim=True)
         z = shift_to_zero + quad_psd
         if self.max is not None:
             z = z - torch.relu(z - self.max)
@@ -500,7 +699,7 @@ class PytorchRNN(nn.Module):
         super().__init__()
         assert len(set(hsizes)) == 1
         self.in_features, self.out_features = insize, outsize
-        self.rnn = nn.RNN(insize, hsizes[0], bias=bias, nonlinearity="relu")
+        self.rnn = nn.RNN(insize, hsizes[0], bias=bias, nonlinearity="relu", batch_first=True)
         self.output = linear_map(hsizes[-1], outsize, bias=bias, **linargs)
 
     def reg_error(self):
@@ -509,13 +708,10 @@ class PytorchRNN(nn.Module):
     def forward(self, x):
         """
 
-        :param x: (torch.Tensor, shape=[nsteps, batchsize, dim]) Input sequence is expanded for order 2 tensors
+        :param x: (torch.Tensor, shape=[batchsize, nsteps, dim]) Input sequence is expanded for order 2 tensors
         :return: (torch.Tensor, shape=[batchsize, outsize]) Returns linear transform of final hidden state of RNN.
         """
-        if len(x.shape) == 2:
-            x = x.reshape(1, *x.shape)
-        elif len(x.shape) == 3:
-            x = x.permute(1, 0, 2)
+        x = x.unsqueeze(1) if x.dim() == 2 else x.contiguous()
         _, hiddens = self.rnn(x)
         return self.output(hiddens[-1])
 
@@ -534,6 +730,7 @@ class RNN(nn.Module):
         nonlin=SoftExponential,
         hsizes=[1],
         linargs=dict(),
+        fused=False,
     ):
         """
 
@@ -544,22 +741,34 @@ class RNN(nn.Module):
         :param nonlin: (callable) Elementwise nonlinearity which takes as input torch.Tensor and outputs torch.Tensor of same shape
         :param hsizes: (list of ints) List of hidden layer sizes
         :param linargs: (dict) Arguments for instantiating linear layer
+        :param fused: (bool) Delegate the recurrence to the fused (cuDNN on GPU) torch.nn.RNN kernel, which is
+                      equivalent for unconstrained linear maps with ReLU or Tanh activations and ignored otherwise.
+                      The recurrent weights then have the torch.nn.RNN state dict keys and initialization.
         """
         super().__init__()
         assert len(set(hsizes)) == 1
         self.in_features, self.out_features = insize, outsize
-        self.rnn = rnn.RNN(
-            insize,
-            hsizes=hsizes,
-            bias=bias,
-            nonlin=nonlin,
-            linear_map=linear_map,
-            linargs=linargs,
-        )
+        self.fused = fused and linear_map in (slim.Linear, nn.Linear) and nonlin in (nn.ReLU, nn.Tanh) and not linargs
+        if self.fused:
+            self.rnn = nn.RNN(insize, hsizes[0], num_layers=len(hsizes), bias=bias,
+                              nonlinearity="relu" if nonlin is nn.ReLU else "tanh", batch_first=True)
+            self.h0 = nn.Parameter(torch.zeros(len(hsizes), 1, hsizes[0]))
+            self.init_states = None
+        else:
+            self.rnn = rnn.RNN(
+                insize,
+                hsizes=hsizes,
+                bias=bias,
+                nonlin=nonlin,
+                linear_map=linear_map,
+                linargs=linargs,
+            )
+            self.init_states = list(self.rnn.init_states)
         self.output = linear_map(hsizes[-1], outsize, bias=bias, **linargs)
-        self.init_states = list(self.rnn.init_states)
 
     def reg_error(self):
+        if self.fused:
+            return self.output.reg_error()
         return self.rnn.reg_error() + self.output.reg_error()
 
     def reset(self):
@@ -572,6 +781,12 @@ class RNN(nn.Module):
         :param x: (torch.Tensor, shape=[nsteps, batchsize, dim]) Input sequence is expanded for order 2 tensors
         :return: (torch.Tensor, shape=[batchsize, outsize]) Returns linear transform of final hidden state of RNN.
         """
+        if self.fused:
+            x = x.unsqueeze(1) if x.dim() == 2 else x.contiguous()
+            h0 = self.h0 if hx is None else torch.stack(list(hx))
+            _, hiddens = self.rnn(x, h0.expand(-1, x.shape[0], -1).contiguous())
+            self.init_states = hiddens
+            return self.output(hiddens[-1])
         if len(x.shape) == 2:
             x = x.reshape(1, *x.shape)
         elif len(x.shape) == 3:
@@ -610,9 +825,10 @@ class BilinearTorch(nn.Module):
         self.f = nn.Bilinear(
             self.in_features, self.in_features, self.out_features, bias=bias
         )
+        self.register_buffer('_zero_reg', torch.zeros(()), persistent=False)
 
     def reg_error(self):
-        return torch.tensor(0.0).to(self.f.weight)
+        return self._zero_reg
 
     def forward(self, x):
         return self.f(x, x)
@@ -622,8 +838,33 @@ class Poly2(nn.Module):
     """
     Feature expansion of network to include pairwise multiplications of features.
     """
-    def __init__(self):
+    def __init__(self, insize=None, numba=False):
+        """
+
+        :param insize: (int) Optional dimensionality of input, otherwise inferred on the first forward pass
+        :param numba: (bool) Expand float CPU inputs with the single pass numba kernel, see neuromancer._poly2_numba.
+                      Falls back to the torch implementation if numba is not installed and under torch.func transforms.
+        """
         super().__init__()
+        self.numba = numba and Poly2Expand is not None
+        self.insize = None
+        self.register_buffer('row_idxs', None, persistent=False)
+        self.register_buffer('col_idxs', None, persistent=False)
+        if insize is not None:
+            self._set_indices(insize)
+
+    def _set_indices(self, insize, device=None):
+        self.insize = insize
+        self.row_idxs, self.col_idxs = torch.triu_indices(insize, insize, device=device)
+
+    @staticmethod
+    def expanded_size(insize):
+        """
+
+        :param insize: (int) dimensionality of input
+        :return: (int) dimensionality of the feature expanded output
+        """
+        return insize + insize * (insize + 1) // 2
 
     def forward(self, x):
         """
@@ -631,9 +872,14 @@ class Poly2(nn.Module):
         :param x: (torch.Tensor, shape=[batchsize, N]) Input tensor
         :return: (torch.Tensor, shape=[batchsize, :math:`\frac{N(N+1)}{2} + N`]) Feature expanded tensor
         """
-        row_idxs, col_idxs = np.triu_indices(x.shape[-1])
-        expansion = torch.matmul(x.unsqueeze(-1), x.unsqueeze(1))  # outer product
-        expansion = expansion[:, row_idxs, col_idxs]  # upper triangular
+        if self.numba and x.device.type == 'cpu' and x.dtype in (torch.float32, torch.float64) \
+                and not torch.compiler.is_compiling() and not torch._C._are_functorch_transforms_active():
+            # single pass numba kernel on CPU, see neuromancer._poly2_numba
+            return Poly2Expand.apply(x.reshape(-1, x.shape[-1])).reshape(*x.shape[:-1], -1)
+        if x.shape[-1] != self.insize or self.row_idxs.device != x.device:
+            self._set_indices(x.shape[-1], device=x.device)
+        # upper triangle of the outer product without materializing the full [batchsize, N, N] tensor
+        expansion = x[..., self.row_idxs] * x[..., self.col_idxs]
         return torch.cat([x, expansion], dim=-1)  # concatenate
 
 
@@ -667,7 +913,10 @@ class BasisLinear(nn.Module):
         super().__init__()
         self.in_features, self.out_features = insize, outsize
         self.expand = expand
-        inlin = self.expand(torch.zeros(1, insize)).shape[-1]
+        if hasattr(self.expand, 'expanded_size'):
+            inlin = self.expand.expanded_size(insize)
+        else:
+            inlin = self.expand(torch.zeros(1, insize)).shape[-1]
         self.linear = linear_map(inlin, outsize, bias=bias, **linargs)
         self.bias = nn.Parameter(torch.zeros(1, outsize), requires_grad=not bias)
 
@@ -683,6 +932,41 @@ class BasisLinear(nn.Module):
         return self.linear(self.expand(x))
 
 
+class GraphedBlock(nn.Module):
+    """
+    Replays the forward and backward pass of a block from CUDA graphs captured for one fixed input shape.
+    Removes per kernel launch overhead, which dominates for small networks on fast GPUs.
+    Inputs with a different shape, or a different train/eval mode than at capture, run the block eagerly.
+    Outputs of graphed calls live in static graph memory and are overwritten by the next call, clone them to keep them.
+    torch.compile(block, mode="reduce-overhead") captures CUDA graphs in the same way and can be used instead.
+    """
+    def __init__(self, block, example_input):
+        """
+
+        :param block: (nn.Module) Block to capture, must not have data dependent control flow
+        :param example_input: (torch.Tensor, shape=[batchsize, insize]) CUDA input with the shape to capture
+        """
+        super().__init__()
+        self.in_features, self.out_features = block.in_features, block.out_features
+        self.shape = example_input.shape
+        self.eager = block.forward
+        # replaces block.forward with the graphed version, the warmup iterations run on a side stream
+        self.block = torch.cuda.make_graphed_callables(block, (example_input,))
+
+    def reg_error(self):
+        return self.block.reg_error()
+
+    def forward(self, x):
+        """
+
+        :param x: (torch.Tensor, shape=[batchsize, insize])
+        :return: (torch.Tensor, shape=[batchsize, outsize])
+        """
+        if x.shape != self.shape:
+            return self.eager(x)
+        return self.block(x)
+
+
 blocks = {
     "mlp": MLP,
     "rnn": RNN,
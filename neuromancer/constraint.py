@@ -79,11 +79,11 @@ class LT(nn.Module):
         loss = metric(penalty)
 
         :param left: torch.Tensor
-        :param right: torch.Tensor
+        :param right: torch.Tensor, or None for a zero right hand side
         :return: zero dimensional torch.Tensor
         """
 
-        value = left - right
+        value = left - right if right is not None else left
         penalty = F.relu(value)
         if self.norm == 2:
             penalty = penalty ** 2
@@ -109,10 +109,10 @@ class GT(nn.Module):
         """
 
         :param left: torch.Tensor
-        :param right: torch.Tensor
+        :param right: torch.Tensor, or None for a zero right hand side
         :return: zero dimensional torch.Tensor
         """
-        value = right - left
+        value = right - left if right is not None else -left
         penalty = F.relu(value)
         if self.norm == 2:
             penalty = penalty ** 2
@@ -141,16 +141,16 @@ class Eq(nn.Module):
         loss = metric(penalty)
 
         :param left: torch.Tensor
-        :param right: torch.Tensor
+        :param right: torch.Tensor, or None for a zero right hand side
         :return: zero dimensional torch.Tensor
         """
-        value = left - right
+        value = left - right if right is not None else left
         if self.norm == 1:
             penalty = torch.abs(value)
-            loss = F.l1_loss(left, right)
         elif self.norm == 2:
             penalty = value**2
-            loss = F.mse_loss(left, right)
+        # mean of the penalty already computed, rather than a second pass over left and right in a loss function
+        loss = torch.mean(penalty)
         return loss, value, penalty
 
 
@@ -244,6 +244,12 @@ class Constraint(Component):
         self.right = right
         self.comparator = comparator
         self.weight = weight
+        # constant zero right hand side, e.g. (u == 0.)^2, is passed to the comparator as None
+        # so the penalty is taken on the left hand side directly instead of on a subtracted copy
+        value = right._value
+        self._zero_right = (isinstance(comparator, (LT, GT, Eq)) and right._func is None and not right._is_input
+                            and isinstance(value, torch.Tensor) and not value.requires_grad
+                            and value.numel() == 1 and value.item() == 0)
 
     def update_name(self, name):
         self.name = name
@@ -287,7 +293,9 @@ class Constraint(Component):
             left = self.left(input_dict)
             if not isinstance(left, torch.Tensor):
                 left = torch.tensor(left)
-        if isinstance(self.right, Variable):
+        if self._zero_right:
+            right = None
+        elif isinstance(self.right, Variable):
             right = self.right(input_dict)
             if not isinstance(right, torch.Tensor):
                 right = torch.tensor(right)
@@ -82,11 +82,12 @@ def _read_file(file_path):
     """
     file_type = file_path.split(".")[-1].lower()
     if file_type == "mat":
-        f = loadmat(file_path)
-        Y = f.get("y", None)  # outputs
-        X = f.get("x", None)
-        U = f.get("u", None)  # inputs
-        D = f.get("d", None)  # disturbances
+        # keep the stored dtypes and cast to float32 once, instead of holding float64 copies
+        f = loadmat(file_path, appendmat=False, mat_dtype=False)
+        Y, X, U, D = [
+            None if f.get(k) is None else f[k].astype(np.float32, copy=False)
+            for k in ["y", "x", "u", "d"]
+        ]  # outputs, states, inputs, disturbances
         id_ = f.get("exp_id", None)  # experiment run id
     elif file_type == "csv":
         data = pd.read_csv(file_path)
@@ -194,10 +195,8 @@ class SequenceDataset(Dataset):
         self.nsteps = nsteps
 
         self.variables = list(keys)
-        self.full_data = torch.cat(
-            [torch.cat([torch.tensor(d[k], dtype=torch.float) for k in self.variables], dim=1) for d in data],
-            dim=0,
-        )
+        sequences = [torch.cat([torch.as_tensor(d[k], dtype=torch.float) for k in self.variables], dim=1) for d in data]
+        self.full_data = torch.cat(sequences, dim=0) if len(sequences) > 1 else sequences[0]
         self.nsim = self.full_data.shape[0]
         self.dims = {k: (self.nsim, *data[0][k].shape[1:],) for k in self.variables}
 
@@ -329,7 +328,7 @@ class StaticDataset(Dataset):
         self.name = name
 
         self.variables = list(data.keys())
-        self.full_data = torch.cat([torch.tensor(data[k], dtype=torch.float) for k in self.variables], dim=1)
+        self.full_data = torch.cat([torch.as_tensor(data[k], dtype=torch.float) for k in self.variables], dim=1)
 
         self.nsamples = self.full_data.shape[0]
         self.dims = {k: (self.nsamples, *data[k].shape[1:],) for k in self.variables}
@@ -597,7 +596,8 @@ def normalize_data(data, norm_type, stats=None):
 
     keys = data[0].keys()
     slices = _get_sequence_time_slices(data)
-    data = {k: np.concatenate([v[k] for v in data], axis=0) for k in keys}
+    # a single sequence is normalized as is, concatenating one array would only copy it
+    data = {k: np.concatenate([v[k] for v in data], axis=0) if len(data) > 1 else data[0][k] for k in keys}
 
     norm_data = [norm_fn(v, k) for k, v in data.items()]
     norm_data, stat0, stat1 = zip(*norm_data)
@@ -690,7 +690,7 @@ def standardize(M, mean=None, std=None):
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         M_norm = (M - mean) / std
-    return np.nan_to_num(M_norm), mean.squeeze(0), std.squeeze(0)
+    return np.nan_to_num(M_norm, copy=False), mean.squeeze(0), std.squeeze(0)
 
 
 def normalize_01(M, Mmin=None, Mmax=None):
@@ -705,7 +705,7 @@ def normalize_01(M, Mmin=None, Mmax=None):
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         M_norm = (M - Mmin) / (Mmax - Mmin)
-    return np.nan_to_num(M_norm), Mmin.squeeze(0), Mmax.squeeze(0)
+    return np.nan_to_num(M_norm, copy=False), Mmin.squeeze(0), Mmax.squeeze(0)
 
 
 def normalize_11(M, Mmin=None, Mmax=None):
@@ -720,7 +720,7 @@ def normalize_11(M, Mmin=None, Mmax=None):
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         M_norm = 2 * ((M - Mmin) / (Mmax - Mmin)) - 1
-    return np.nan_to_num(M_norm), Mmin.squeeze(0), Mmax.squeeze(0)
+    return np.nan_to_num(M_norm, copy=False), Mmin.squeeze(0), Mmax.squeeze(0)
 
 
 def denormalize_01(M, Mmin, Mmax):
@@ -764,7 +764,8 @@ denorm_fns = {
 }
 
 
-def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0, batch_size=32):
+def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0, batch_size=32,
+                           dataloader_kwargs=None):
     """This will generate dataloaders for a given dictionary of data.
     Dataloaders are hard-coded for full-batch training to match NeuroMANCER's training setup.
 
@@ -774,8 +775,10 @@ def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0
     :param norm_type: (str) type of normalization; see function `normalize_data` for more info.
     :param split_ratio: (list float) percentage of data in train and development splits; see
         function `split_sequence_data` for more info.get_static_dataloaders
+    :param dataloader_kwargs: (dict, optional) extra keyword arguments passed to each DataLoader,
+        e.g. pin_memory, prefetch_factor or persistent_workers.
     """
-
+    dataloader_kwargs = dataloader_kwargs or {}
     if norm_type is not None:
         data, _ = normalize_data(data, norm_type)
     train_data, dev_data, test_data = split_static_data(data, split_ratio)
@@ -799,6 +802,7 @@ def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0
         shuffle=True,
         collate_fn=train_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
     dev_data = DataLoader(
         dev_data,
@@ -806,6 +810,7 @@ def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0
         shuffle=False,
         collate_fn=dev_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
     test_data = DataLoader(
         test_data,
@@ -813,6 +818,7 @@ def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0
         shuffle=False,
         collate_fn=test_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
 
     return (train_data, dev_data, test_data), train_data.dataset.dims
@@ -820,7 +826,7 @@ def get_static_dataloaders(data, norm_type=None, split_ratio=None, num_workers=0
 
 def get_sequence_dataloaders(
     data, nsteps, moving_horizon=False, norm_type=None, split_ratio=None,
-        num_workers=0, batch_size=None):
+        num_workers=0, batch_size=None, dataloader_kwargs=None):
     """
     This function will generate dataloaders and open-loop sequence dictionaries for a given dictionary of
     data. Dataloaders are hard-coded for full-batch training to match NeuroMANCER's original
@@ -838,7 +844,10 @@ def get_sequence_dataloaders(
             0 means that the data will be loaded in the main process. (default: 0)
     :param batch_size: (int, optional) how many samples per batch to load
             (default: full-batch via len(data)).
+    :param dataloader_kwargs: (dict, optional) extra keyword arguments passed to each DataLoader,
+            e.g. pin_memory, prefetch_factor or persistent_workers.
     """
+    dataloader_kwargs = dataloader_kwargs or {}
     if norm_type is not None:
         data, _ = normalize_data(data, norm_type)
     train_data, dev_data, test_data = split_sequence_data(data, nsteps, moving_horizon, split_ratio)
@@ -880,6 +889,7 @@ def get_sequence_dataloaders(
         shuffle=False,
         collate_fn=train_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
     dev_data = DataLoader(
         dev_data,
@@ -887,6 +897,7 @@ def get_sequence_dataloaders(
         shuffle=False,
         collate_fn=dev_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
     test_data = DataLoader(
         test_data,
@@ -894,6 +905,7 @@ def get_sequence_dataloaders(
         shuffle=False,
         collate_fn=test_data.collate_fn,
         num_workers=num_workers,
+        **dataloader_kwargs,
     )
 
     return (train_data, dev_data, test_data), (train_loop, dev_loop, test_loop), train_data.dataset.dims
@@ -38,8 +38,124 @@ Block components:
 import torch
 import torch.nn as nn
 from typing import List
+from torch.utils.checkpoint import checkpoint
 import slim
 from neuromancer.component import Component
+from neuromancer.blocks import segment_bounds
+
+
+class StepBuffer:
+    """
+    Collects the per step tensors of a rollout into a single [batchsize, nsteps, ...] tensor.
+    Without autograd the steps are written into one preallocated tensor, which avoids the list and the final
+    stack copy. With autograd they are stacked at the end, since in-place writes into a shared output would
+    copy the full output gradient once per step in the backward pass. Unstacked buffers return the steps as
+    a tuple instead.
+    """
+    def __init__(self, nsteps, stacked=True):
+        """
+        :param nsteps: (int) Number of steps in the rollout
+        :param stacked: (bool) Return the steps as one tensor, otherwise as a tuple of per step tensors
+        """
+        self.nsteps, self.nsteps_written = nsteps, 0
+        self.steps, self.buffer = [], None
+        self.stacked = stacked
+        self.preallocated = not torch.is_grad_enabled()
+
+    def append(self, x):
+        """
+        :param x: (torch.Tensor, shape=[batchsize, ...]) Tensor for the next step
+        """
+        if self.preallocated:
+            if self.buffer is None:
+                self.buffer = x.new_empty(x.shape[0], self.nsteps, *x.shape[1:])
+            self.buffer[:, self.nsteps_written] = x
+        else:
+            self.steps.append(x)
+        self.nsteps_written += 1
+
+    def stack(self):
+        """
+        :return: (torch.Tensor, shape=[batchsize, nsteps, ...]) or tuple of nsteps (torch.Tensor, shape=[batchsize, ...])
+                 if not stacked, None if nothing was appended
+        """
+        if self.nsteps_written == 0:
+            return None
+        if self.preallocated:
+            steps = self.buffer[:, :self.nsteps_written]
+            return steps if self.stacked else steps.unbind(1)
+        return torch.stack(self.steps, dim=1) if self.stacked else tuple(self.steps)
+
+
+# elementwise ops which the rollouts apply as inline tensor operators instead of calling them
+ELEMENTWISE_OPS = {torch.add: 0, torch.mul: 1, torch.sub: 2}
+
+
+def op_code(op):
+    """
+    :param op: (callable) Elementwise tensor op
+    :return: (int) Tag of the op in ELEMENTWISE_OPS, -1 for other callables
+    """
+    return ELEMENTWISE_OPS.get(op, -1)
+
+
+def apply_op(code, op, x, y):
+    """
+    Apply an elementwise op by its tag so that known ops are plain tensor operators which a compiled rollout
+    can fuse with the surrounding pointwise ops. Ops with tag -1 are called as given.
+
+    :param code: (int) Tag of the op from op_code
+    :param op: (callable) Elementwise tensor op
+    :param x: (torch.Tensor) First operand
+    :param y: (torch.Tensor) Second operand
+    :return: (torch.Tensor) op(x, y)
+    """
+    if code == 0:
+        return x + y
+    elif code == 1:
+        return x * y
+    elif code == 2:
+        return x - y
+    return op(x, y)
+
+
+def affine_rollout(x, fUD, Wx):
+    """
+    Affine recurrence :math:`x_{t+1} = x_t W_x + f_{UD}(t)` as a pure tensor function without module calls.
+
+    :param x: (torch.Tensor, shape=[batchsize, nx]) Initial state
+    :param fUD: (torch.Tensor, shape=[batchsize, nsteps, nx]) Input terms of the steps
+    :param Wx: (torch.Tensor, shape=[nx, nx]) State transition weight
+    :return: (torch.Tensor, shape=[batchsize, nsteps, nx]) States of the steps
+    """
+    X = StepBuffer(fUD.shape[1])
+    for i in range(fUD.shape[1]):
+        x = torch.addmm(fUD[:, i], x, Wx)
+        X.append(x)
+    return X.stack()
+
+
+def segmented_rollout(rollout, x, nsteps, checkpoint_segments, *args):
+    """
+    Run a rollout over nsteps, optionally in checkpointed segments. Only the state at segment boundaries and the
+    segment outputs are kept for backward, the intermediate activations of each segment are recomputed.
+
+    :param rollout: (callable) rollout(x, start, end, *args) returning the final state and the [batchsize, end - start, ...]
+                    outputs of the steps in [start, end), None for absent outputs
+    :param x: (torch.Tensor, shape=[batchsize, nx]) Initial state
+    :param nsteps: (int) Number of steps
+    :param checkpoint_segments: (int or bool) Number of checkpointed segments, True uses sqrt(nsteps) segments and 0 runs
+                                the rollout without checkpointing
+    :return: (list of torch.Tensor) Outputs of the rollout over all steps, per step outputs are joined as tuples
+    """
+    if not checkpoint_segments or not torch.is_grad_enabled():
+        return rollout(x, 0, nsteps, *args)[1:]
+    segments = []
+    for start, end in segment_bounds(nsteps, None if checkpoint_segments is True else checkpoint_segments):
+        x, *outputs = checkpoint(rollout, x, start, end, *args, use_reentrant=False, preserve_rng_state=True)
+        segments.append(outputs)
+    return [None if steps[0] is None else torch.cat(steps, dim=1) if isinstance(steps[0], torch.Tensor)
+            else sum(steps, ()) for steps in zip(*segments)]
 
 
 class SSM(Component):
@@ -74,6 +190,51 @@ class SSM(Component):
         self.update_input_keys(input_key_map=input_key_map)
         output_keys = [f"{k}_{name}" if name is not None else k for k in self.DEFAULT_OUTPUT_KEYS]
         super().__init__(input_keys=self.input_keys, output_keys=output_keys, name=name)
+        self._out_keys = tuple(self.output_keys)
+        self._reg_children = None
+        self.register_buffer('_zero_reg', torch.zeros(()), persistent=False)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if isinstance(value, nn.Module):
+            # submodules changed, the regularized children are collected again on the next reg_error call
+            self.__dict__['_reg_children'] = None
+
+    def compile_rollout(self, compiled):
+        """
+        Compile the forward pass with torch.compile, specialized to fixed shapes. Each new horizon length,
+        batch size or state size triggers a recompilation, so these should stay constant across calls.
+
+        :param compiled: (bool or str) Whether to compile, a string is passed as the torch.compile mode, e.g.
+                         'reduce-overhead' to capture the rollout in a CUDA graph. CUDA graph outputs are
+                         overwritten by the next call, so they need to be cloned if kept across calls.
+        """
+        if compiled:
+            self.compile(dynamic=False, mode=compiled if isinstance(compiled, str) else None)
+
+    def observe(self, X, YU=None):
+        """
+        Apply the observation map fy to the states of all steps of a segment in a single call. Unlike the state
+        transition it does not feed back into the recurrence, so the rollouts only step the states.
+
+        :param X: (torch.Tensor, shape=[batchsize, nsteps, nx]) States of the steps
+        :param YU: (torch.Tensor, shape=[batchsize, nsteps, ny]) Input term of the outputs joined by xoyu or None
+        :return: (tuple) X and Y of the steps, as tuples of steps if stack_outputs is False
+        """
+        Y = self.fy(X.flatten(0, 1)).unflatten(0, X.shape[:2])
+        if YU is not None:
+            Y = apply_op(self._op_xoyu, self.xoyu, Y, YU)
+        return (X, Y) if self.stack_outputs else (X.unbind(1), Y.unbind(1))
+
+    def reg_error(self):
+        """
+        :return: 0-dimensional torch.Tensor
+        """
+        if self._reg_children is None:
+            self._reg_children = tuple(k for k in self.children() if hasattr(k, 'reg_error'))
+        if not self._reg_children:
+            return self._zero_reg
+        return sum([k.reg_error() for k in self._reg_children])
 
     def update_input_keys(self, input_key_map={}):
         assert isinstance(input_key_map, dict), \
@@ -83,6 +244,10 @@ class SSM(Component):
             **input_key_map
         }
         self.input_keys = list(self.input_key_map.values())
+        # data keys are resolved once here instead of looking up the key map in every forward pass
+        self._k_x0, self._k_Yf, self._k_Uf, self._k_Df, self._k_Time = \
+            (self.input_key_map.get(k) for k in ['x0', 'Yf', 'Uf', 'Df', 'Time'])
+        self._k_extra = tuple(self.input_key_map[k] for k in getattr(self, 'extra_inputs', []))
 
 
 class BlockSSM(SSM):
@@ -95,7 +260,8 @@ class BlockSSM(SSM):
     """
     def __init__(self, fx, fy, fu=None, fd=None, fe=None, fyu=None,
                  xou=torch.add, xod=torch.add, xoe=torch.add, xoyu=torch.add,
-                 residual=False, name='block_ssm', input_key_map={}):
+                 residual=False, name='block_ssm', input_key_map={}, compiled=False, checkpoint_segments=0,
+                 stack_outputs=True):
         """
         :param fx: (nn.Module) State transition function
         :param fy: (nn.Module) Observation function
@@ -110,6 +276,15 @@ class BlockSSM(SSM):
         :param residual: (bool) Whether to make recurrence in state space model residual
         :param name: (str) Name for tracking output
         :param input_key_map: (dict {str: str}) Mapping canonical expected input keys to alternate names
+        :param compiled: (bool or str) Compile the rollout with torch.compile, see SSM.compile_rollout. Branches on the
+                         optional blocks are resolved at trace time and the time loop is unrolled into one graph per
+                         horizon length.
+        :param checkpoint_segments: (int or bool) Split the rollout into this many gradient checkpointed segments when
+                                    autograd is on. True picks sqrt(nsteps) segments for the horizon of each call.
+                                    0 keeps all activations of the rollout.
+        :param stack_outputs: (bool) Return the predicted states, outputs and error terms as [batchsize, nsteps, dim]
+                              tensors. If False they are returned as tuples of nsteps [batchsize, dim] tensors, which
+                              saves the stacking copy for losses that reduce over the steps themselves.
         """
         if fu is not None:
             self.DEFAULT_INPUT_KEYS = self.DEFAULT_INPUT_KEYS + ['Uf']
@@ -134,6 +309,19 @@ class BlockSSM(SSM):
         self.residual = residual
 
         self.xou, self.xod, self.xoe, self.xoyu = xou, xod, xoe, xoyu
+        self._op_xou, self._op_xod, self._op_xoe, self._op_xoyu = (op_code(op) for op in [xou, xod, xoe, xoyu])
+        # with additive input and disturbance ops both terms can be summed ahead of the rollout
+        self.additive_inputs = xou is torch.add and xod is torch.add
+        # with an additive error term as well every step is one chained sum of the state transition and its addends
+        self.additive_step = self.additive_inputs and xoe is torch.add
+        # an unconstrained linear state transition can be fused with the additive input terms
+        self.linear_fx = type(fx) in (slim.Linear, nn.Linear)
+        # the identity of a residual connection joins the fused linear weight, unless a non-additive error term is
+        # applied between the state transition and the residual sum
+        self.residual_weight = residual and (fe is None or self.additive_step)
+        self.checkpoint_segments = checkpoint_segments
+        self.stack_outputs = stack_outputs
+        self.compile_rollout(compiled)
 
     def check_features(self):
         self.nx, self.ny = self.fx.in_features, self.fy.out_features
@@ -155,42 +343,87 @@ class BlockSSM(SSM):
         :param data: (dict: {str: Tensor})
         :return: output (dict: {str: Tensor})
         """
-        nsteps = data[self.input_key_map['Yf']].shape[1]
-        X, Y, FD, FU, FE = [], [], [], [], []
-        x = data[self.input_key_map['x0']]
-        for i in range(nsteps):
+        nsteps = data[self._k_Yf].shape[1]
+        x = data[self._k_x0]
+        # fu, fd and fyu do not depend on the state, so each is evaluated for all steps in one call
+        Uf = data[self._k_Uf][:, :nsteps] if self.fu is not None or self.fyu is not None else None
+        fU = self.over_steps(self.fu, Uf) if self.fu is not None else None
+        fD = self.over_steps(self.fd, data[self._k_Df][:, :nsteps]) if self.fd is not None else None
+        fYU = self.over_steps(self.fyu, Uf) if self.fyu is not None else None
+        fUD = None
+        if self.additive_inputs and (fU is not None or fD is not None):
+            fUD = fU + fD if fU is not None and fD is not None else fU if fU is not None else fD
+        Wx = None
+        if self.linear_fx and fUD is not None:
+            # the bias of fx joins the input terms, so each step is a single addmm of the state with the weight
+            Wx = self.fx.weight.T if isinstance(self.fx, nn.Linear) else self.fx.effective_W()
+            fUD = fUD + self.fx(x.new_zeros(1, self.nx))
+            if self.residual_weight:
+                Wx = Wx + torch.eye(self.nx, dtype=Wx.dtype, device=Wx.device)
+        Xpred, Ypred, FE = segmented_rollout(self.rollout, x, nsteps, self.checkpoint_segments,
+                                             fU, fD, fUD, fYU, Wx)
+        tensors = [Xpred, Ypred, fU, fD, FE]
+        output = {name: tensor for tensor, name
+                  in zip([t for t in tensors if t is not None], self._out_keys[1:])}
+        output[self._out_keys[0]] = self.reg_error()
+        return output
+
+    def rollout(self, x, start, end, fU, fD, fUD, fYU, Wx):
+        """
+        Rollout of the state transitions for steps in [start, end)
+        :param x: (torch.Tensor, shape=[batchsize, nx]) State at step start
+        :param fU, fD, fUD, fYU: (torch.Tensor, shape=[batchsize, nsteps, dim]) Precomputed input terms or None
+        :param Wx: (torch.Tensor, shape=[nx, nx]) Weight of a linear fx fused with fUD, which then includes the bias
+                   of fx, and the residual identity if residual_weight, or None
+        :return: (tuple) State at step end, and X, Y, FE of the steps, FE is None without error model
+        """
+        residual = self.residual and not (Wx is not None and self.residual_weight)
+        if Wx is not None and self.fe is None:
+            # a purely affine recurrence: only the state update is stepped, the output map is applied to all
+            # states of the segment at once
+            X = affine_rollout(x, fUD[:, start:end], Wx)
+            return (X[:, -1], *self.observe(X, fYU[:, start:end] if fYU is not None else None), None)
+        X, FE = StepBuffer(end - start), StepBuffer(end - start, self.stack_outputs)
+        for i in range(start, end):
             x_prev = x
-            x = self.fx(x)
-            if self.fu is not None:
-                fu = self.fu(data[self.input_key_map['Uf']][:, i, :])
-                x = self.xou(x, fu)
-                FU.append(fu)
-            if self.fd is not None:
-                fd = self.fd(data[self.input_key_map['Df']][:, i, :])
-                x = self.xod(x, fd)
-                FD.append(fd)
-            if self.fe is not None:
-                fe = self.fe(x_prev)
-                x = self.xoe(x, fe)
-                FE.append(fe)
-            if self.residual:
-                x += x_prev
-            y = self.fy(x)
-            if self.fyu is not None:
-                fyu = self.fyu(data[self.input_key_map['Uf']][:, i, :])
-                y = self.xoyu(y, fyu)
+            if self.additive_step:
+                addends = [fUD[:, i]] if fUD is not None and Wx is None else []
+                if self.fe is not None:
+                    fe = self.fe(x_prev)
+                    addends.append(fe)
+                    FE.append(fe)
+                if residual:
+                    addends.append(x_prev)
+                x = sum(addends, torch.addmm(fUD[:, i], x, Wx) if Wx is not None else self.fx(x))
+            else:
+                if Wx is not None:
+                    x = torch.addmm(fUD[:, i], x, Wx)
+                elif fUD is not None:
+                    x = self.fx(x) + fUD[:, i]
+                else:
+                    x = self.fx(x)
+                    if self.fu is not None:
+                        x = apply_op(self._op_xou, self.xou, x, fU[:, i])
+                    if self.fd is not None:
+                        x = apply_op(self._op_xod, self.xod, x, fD[:, i])
+                if self.fe is not None:
+                    fe = self.fe(x_prev)
+                    x = apply_op(self._op_xoe, self.xoe, x, fe)
+                    FE.append(fe)
+                if residual:
+                    x = x + x_prev
             X.append(x)
-            Y.append(y)
-        tensor_lists = [X, Y, FU, FD, FE]
-        tensor_lists = [t for t in tensor_lists if t]
-        output = {name: torch.stack(tensor_list, dim=1) for tensor_list, name
-                  in zip(tensor_lists, self.output_keys[1:])
-                  if tensor_list}
-        output[self.output_keys[0]] = self.reg_error()
-        return output
+        return (x, *self.observe(X.stack(), fYU[:, start:end] if fYU is not None else None), FE.stack())
 
-    def reg_error(self):
-        return sum([k.reg_error() for k in self.children() if hasattr(k, 'reg_error')])
+    @staticmethod
+    def over_steps(f, U):
+        """
+        Apply a map which acts on each time step independently to all steps of a sequence in a single call
+        :param f: (nn.Module) Map to apply
+        :param U: (torch.Tensor, shape=[batchsize, nsteps, dim])
+        :return: (torch.Tensor, shape=[batchsize, nsteps, f.out_features])
+        """
+        return f(U.reshape(-1, U.shape[-1])).reshape(U.shape[0], U.shape[1], -1)
 
 
 class LinearSSM(BlockSSM):
@@ -268,7 +501,8 @@ class BlackSSM(SSM):
     """
 
     def __init__(self, fx, fy, fe=None, fyu=None, xoe=torch.add, xoyu=torch.add, name='black_ssm',
-                 input_key_map={}, extra_inputs=[]):
+                 input_key_map={}, extra_inputs=[], compiled=False, checkpoint_segments=0,
+                 stack_outputs=True):
         """
         :param fx: (nn.Module) State transition function depending on previous state, inputs and disturbances
         :param fy: (nn.Module) Observation function
@@ -280,6 +514,9 @@ class BlackSSM(SSM):
         :param input_key_map: (dict {str: str}) Mapping canonical expected input keys to alternate names
         :param residual: (bool) Whether to make recurrence in state space model residual
         :param extra_inputs: (list of str) Input keys to be added to canonical input.
+        :param compiled: (bool or str) Compile the rollout with torch.compile, see SSM.compile_rollout
+        :param checkpoint_segments: (int) Number of gradient checkpointed segments of the rollout, see BlockSSM
+        :param stack_outputs: (bool) Return the predictions as tensors, otherwise as tuples of steps, see BlockSSM
         """
         self.DEFAULT_INPUT_KEYS = self.DEFAULT_INPUT_KEYS + extra_inputs
         self.extra_inputs = extra_inputs
@@ -292,43 +529,88 @@ class BlackSSM(SSM):
         self.nx, self.ny = self.fx.out_features, self.fy.out_features
         self.xoe = xoe
         self.xoyu = xoyu
+        self._op_xoe, self._op_xoyu = op_code(xoe), op_code(xoyu)
+        # the extra input parts of an unconstrained linear fx or fyu do not depend on the state
+        self.linear_fx = type(fx) in (slim.Linear, nn.Linear)
+        self.linear_fyu = type(fyu) in (slim.Linear, nn.Linear)
+        self.checkpoint_segments = checkpoint_segments
+        self.stack_outputs = stack_outputs
+        self.compile_rollout(compiled)
 
     def forward(self, data):
         """
         performs nstep ahead rollout of a given dynamical system model
         """
-        nsteps = data[self.input_key_map['Yf']].shape[1]
-        X, Y, FE = [], [], []
+        nsteps = data[self._k_Yf].shape[1]
+        x = data[self._k_x0]
+        # extra inputs are concatenated once for all steps so each step appends a single tensor to the state
+        extra = torch.cat([data[k] for k in self._k_extra], dim=-1)[:, :nsteps] \
+            if self.extra_inputs else None
+        fXE, Wx = None, None
+        if self.linear_fx and extra is not None:
+            # likewise for fx, each step is then a single addmm of the state with its rows of the weight
+            fXE = self.fx(nn.functional.pad(extra, (self.nx, 0)))
+            Wx = (self.fx.weight.T if isinstance(self.fx, nn.Linear) else self.fx.effective_W())[:self.nx]
+        fYE, Wyx = None, None
+        if self.linear_fyu and extra is not None:
+            # fyu applied to the extra inputs with a zero state is evaluated for all steps in one call, so each
+            # step only multiplies the state with its columns of the weight
+            fYE = self.fyu(nn.functional.pad(extra, (self.nx, 0)))
+            Wyx = (self.fyu.weight if isinstance(self.fyu, nn.Linear) else self.fyu.effective_W().T)[:, :self.nx]
+        tensors = [t for t in segmented_rollout(self.rollout, x, nsteps, self.checkpoint_segments,
+                                                extra, fXE, Wx, fYE, Wyx) if t is not None]
+        output = {name: tensor for tensor, name in zip(tensors, self._out_keys[1:])}
+        output[self._out_keys[0]] = self.reg_error()
+        return output
 
-        x = data[self.input_key_map['x0']]
-        for i in range(nsteps):
+    def rollout(self, x, start, end, extra, fXE, Wx, fYE, Wyx):
+        """
+        Rollout of the state transitions for steps in [start, end)
+        :param x: (torch.Tensor, shape=[batchsize, nx]) State at step start
+        :param extra: (torch.Tensor, shape=[batchsize, nsteps, dim]) Concatenated extra inputs or None
+        :param fXE: (torch.Tensor, shape=[batchsize, nsteps, nx]) Linear fx of the extra inputs or None
+        :param Wx: (torch.Tensor, shape=[nx, nx]) State rows of the linear fx weight or None
+        :param fYE: (torch.Tensor, shape=[batchsize, nsteps, ny]) Linear fyu of the extra inputs or None
+        :param Wyx: (torch.Tensor, shape=[ny, nx]) State columns of the linear fyu weight or None
+        :return: (tuple) State at step end, and X, Y, FE of the steps, FE is None without error model
+        """
+        X, FE = StepBuffer(end - start), StepBuffer(end - start, self.stack_outputs)
+        # a nonlinear fyu is evaluated per step on the state concatenated with the extra inputs
+        FYU = StepBuffer(end - start) if self.fyu is not None and fYE is None else None
+        x_start = x
+        if fXE is not None and (self.fyu is None or fYE is not None):
+            # both maps of the extra inputs are precomputed, the state is never concatenated with them
+            extra = None
+        Xplus = None
+        if extra is not None and not torch.is_grad_enabled():
+            # without autograd each state is written in front of the extra inputs of its step in a preallocated
+            # buffer, instead of being concatenated with them into a new tensor
+            Xplus = nn.functional.pad(extra[:, start:end], (self.nx, 0))
+        extra = extra[:, start:end].unbind(1) if extra is not None else None
+        fXE = fXE[:, start:end].unbind(1) if fXE is not None else None
+        for i in range(end - start):
             x_prev = x
-            xplus = torch.cat([x] + [data[self.input_key_map[k]][:, i, :] for k in self.extra_inputs], dim=1)
-            x = self.fx(xplus)
+            if Xplus is not None:
+                xplus = Xplus[:, i]
+                xplus[:, :self.nx] = x
+            else:
+                xplus = torch.cat([x, extra[i]], dim=1) if extra is not None else x
+            x = torch.addmm(fXE[i], x, Wx) if fXE is not None else self.fx(xplus)
             if self.fe is not None:
                 fe = self.fe(x_prev)
-                x = self.xoe(x, fe)
+                x = apply_op(self._op_xoe, self.xoe, x, fe)
                 FE.append(fe)
-            y = self.fy(x)
-            if self.fyu is not None:
-                fyu = self.fyu(xplus)
-                y = self.xoyu(y, fyu)
+            if FYU is not None:
+                FYU.append(self.fyu(xplus))
             X.append(x)
-            Y.append(y)
-        tensor_lists = [X, Y, FE]
-        tensor_lists = [t for t in tensor_lists if t]
-        output = {name: torch.stack(tensor_list, dim=1) for tensor_list, name
-                  in zip(tensor_lists, self.output_keys[1:])
-                  if tensor_list}
-        output[self.output_keys[0]] = self.reg_error()
-        return output
-
-    def reg_error(self):
-        """
-
-        :return: 0-dimensional torch.Tensor
-        """
-        return sum([k.reg_error() for k in self.children() if hasattr(k, 'reg_error')])
+        X = X.stack()
+        if fYE is not None:
+            # a linear fyu acts on the previous state of each step, which is done for all steps in one call
+            X_prev = torch.cat([x_start.unsqueeze(1), X[:, :-1]], dim=1)
+            YU = nn.functional.linear(X_prev, Wyx) + fYE[:, start:end]
+        else:
+            YU = FYU.stack() if FYU is not None else None
+        return (x, *self.observe(X, YU), FE.stack())
 
     def check_features(self):
         self.nx, self.ny = self.fx.out_features, self.fy.out_features
@@ -346,12 +628,16 @@ class ODEAuto(SSM):
         :math:`ODESolve(f_x(x_t))` - ODE solver that integrates the ODE system, e.g. RK
     """
 
-    def __init__(self, fx, fy, name='dynamics', input_key_map={}):
+    def __init__(self, fx, fy, name='dynamics', input_key_map={}, compiled=False, checkpoint_segments=0,
+                 stack_outputs=True):
         """
         :param fx: (nn.Module) State transition function depending on previous state, inputs and disturbances
         :param fy: (nn.Module) Observation function
         :param name: (str) Name for tracking output
         :param input_key_map: (dict {str: str}) Mapping canonical expected input keys to alternate names
+        :param compiled: (bool or str) Compile the rollout with torch.compile, see SSM.compile_rollout
+        :param checkpoint_segments: (int) Number of gradient checkpointed segments of the rollout, see BlockSSM
+        :param stack_outputs: (bool) Return the predictions as tensors, otherwise as tuples of steps, see BlockSSM
         """
         self.DEFAULT_INPUT_KEYS = self.DEFAULT_INPUT_KEYS
 
@@ -359,32 +645,32 @@ class ODEAuto(SSM):
 
         self.fx, self.fy = fx, fy
         self.nx, self.ny = self.fx.out_features, self.fy.out_features
+        self.checkpoint_segments = checkpoint_segments
+        self.stack_outputs = stack_outputs
+        self.compile_rollout(compiled)
 
     def forward(self, data):
         """
         performs nstep ahead rollout of a given dynamical system model
         """
-        nsteps = data[self.input_key_map['Yf']].shape[1]
-        x = data[self.input_key_map['x0']]
-        X, Y = [], []
-        for i in range(nsteps):
-            x = self.fx(x)
-            y = self.fy(x)
-            X.append(x)
-            Y.append(y)
-        tensor_lists = [X, Y]
-        tensor_lists = [t for t in tensor_lists if t]
-        output = {name: torch.stack(tensor_list, dim=1) for tensor_list, name
-                  in zip(tensor_lists, self.output_keys[1:])
-                  if tensor_list}
-        output[self.output_keys[0]] = self.reg_error()
+        nsteps = data[self._k_Yf].shape[1]
+        x = data[self._k_x0]
+        tensors = [t for t in segmented_rollout(self.rollout, x, nsteps, self.checkpoint_segments) if t is not None]
+        output = {name: tensor for tensor, name in zip(tensors, self._out_keys[1:])}
+        output[self._out_keys[0]] = self.reg_error()
         return output
 
-    def reg_error(self):
+    def rollout(self, x, start, end):
         """
-        :return: 0-dimensional torch.Tensor
+        Rollout of the state transitions for steps in [start, end)
+        :param x: (torch.Tensor, shape=[batchsize, nx]) State at step start
+        :return: (tuple) State at step end, and X, Y of the steps
         """
-        return sum([k.reg_error() for k in self.children() if hasattr(k, 'reg_error')])
+        X = StepBuffer(end - start)
+        for i in range(start, end):
+            x = self.fx(x)
+            X.append(x)
+        return (x, *self.observe(X.stack()))
 
 
 class ODENonAuto(SSM):
@@ -397,14 +683,19 @@ class ODENonAuto(SSM):
         :math:`dx_t/dt = f_x(x_t, u_t, Time)` - defined ODE system with inputs u_t and Time
         :math:`ODESolve(f_x(x_t, u_t, Time))` - ODE solver that integrates the ODE system, e.g. RK
     """
-    def __init__(self, fx, fy, name='dynamics', input_key_map={}, extra_inputs=[], online_flag=False):
+    def __init__(self, fx, fy, name='dynamics', input_key_map={}, extra_inputs=[], online_flag=False,
+                 checkpoint_segments=0, stack_outputs=True, compiled=False):
         """
         :param fx: (nn.Module) State transition function depending on previous state, inputs and disturbances
         :param fy: (nn.Module) Observation function
         :param name: (str) Name for tracking output
         :param input_key_map: (dict {str: str}) Mapping canonical expected input keys to alternate names
         :param extra_inputs: (list of str) Input keys to be added to canonical input.
-        :param online_flag: (bool) whether to use online interpolation or not.
+        :param online_flag: (bool) whether to use online interpolation or not. The rollout is chosen once per
+                            forward pass, see rollout and rollout_online.
+        :param checkpoint_segments: (int) Number of gradient checkpointed segments of the rollout, see BlockSSM
+        :param stack_outputs: (bool) Return the predictions as tensors, otherwise as tuples of steps, see BlockSSM
+        :param compiled: (bool or str) Compile the rollout with torch.compile, see SSM.compile_rollout
         """
         self.DEFAULT_INPUT_KEYS = self.DEFAULT_INPUT_KEYS + extra_inputs
         self.extra_inputs = extra_inputs
@@ -412,46 +703,81 @@ class ODENonAuto(SSM):
         self.fx, self.fy = fx, fy
         self.nx, self.ny = self.fx.out_features, self.fy.out_features
         self.online_flag = online_flag
+        self.checkpoint_segments = checkpoint_segments
+        self.stack_outputs = stack_outputs
+        self.compile_rollout(compiled)
 
     def forward(self, data):
         """
         performs nstep ahead rollout of a given dynamical system model
         """
-        nsteps = data[self.input_key_map['Yf']].shape[1]
-        x = data[self.input_key_map['x0']]
-        if 'Time' in self.input_key_map.keys():
-            Time = data[self.input_key_map['Time']]  # (# of batches, nsteps, 1)
+        nsteps = data[self._k_Yf].shape[1]
+        x = data[self._k_x0]
+        if self._k_Time is not None:
+            Time = data[self._k_Time]  # (# of batches, nsteps, 1)
         else:
             # dummy time tensor that won't be used
-            Time = torch.ones(data[self.input_key_map['Yf']].shape[0], nsteps, 1)
-        inputs = torch.cat([data[self.input_key_map[k]] for k in self.extra_inputs], dim=-1) \
-            if len(self.extra_inputs) is not 0 else Time
-        X, Y = [], []
-        for i in range(nsteps):
-            if self.online_flag:
-                if i == nsteps-1:
-                    pass
-                else:
-                    x = self.fx(x, inputs[:, i:i+2, :], Time[:, i:i+2, :])
-            else:
-                x = self.fx(x, inputs[:, i, :], Time[:, i, :])
-            y = self.fy(x)
-            X.append(x)
-            Y.append(y)
-        tensor_lists = [X, Y]
-        tensor_lists = [t for t in tensor_lists if t]
-        output = {name: torch.stack(tensor_list, dim=1) for tensor_list, name
-                  in zip(tensor_lists, self.output_keys[1:])
-                  if tensor_list}
-        output[self.output_keys[0]] = self.reg_error()
+            Time = torch.ones(data[self._k_Yf].shape[0], nsteps, 1)
+        inputs = torch.cat([data[k] for k in self._k_extra], dim=-1) \
+            if self._k_extra else Time
+        if self.online_flag:
+            rollout = self.rollout_online
+            inputs, Time = self.extrapolate(inputs[:, :nsteps]), self.extrapolate(Time[:, :nsteps], hold=False)
+        else:
+            rollout = self.rollout
+        tensors = [t for t in segmented_rollout(rollout, x, nsteps, self.checkpoint_segments, inputs, Time)
+                   if t is not None]
+        output = {name: tensor for tensor, name in zip(tensors, self._out_keys[1:])}
+        output[self._out_keys[0]] = self.reg_error()
         return output
 
-    def reg_error(self):
+    @staticmethod
+    def extrapolate(sequence, hold=True):
         """
+        Append one step to a sequence for the interval following its last step
 
-        :return: 0-dimensional torch.Tensor
+        :param sequence: (torch.Tensor, shape=[batchsize, nsteps, dim])
+        :param hold: (bool) Repeat the last step, otherwise extend linearly with the last increment
+        :return: (torch.Tensor, shape=[batchsize, nsteps + 1, dim])
+        """
+        last = sequence[:, -1:]
+        if not hold:
+            last = last + (last - sequence[:, -2:-1] if sequence.shape[1] > 1 else torch.ones_like(last))
+        return torch.cat([sequence, last], dim=1)
+
+    def rollout(self, x, start, end, inputs, Time):
+        """
+        Rollout of the state transitions for steps in [start, end) with offline interpolation of the inputs
+        :param x: (torch.Tensor, shape=[batchsize, nx]) State at step start
+        :param inputs: (torch.Tensor, shape=[batchsize, nsteps, dim]) Inputs of the ODE system
+        :param Time: (torch.Tensor, shape=[batchsize, nsteps, 1]) Time of each step
+        :return: (tuple) State at step end, and X, Y of the steps
         """
-        return sum([k.reg_error() for k in self.children() if hasattr(k, 'reg_error')])
+        X = StepBuffer(end - start)
+        inputs_t, Time_t = inputs[:, start:end].unbind(1), Time[:, start:end].unbind(1)
+        for i in range(end - start):
+            x = self.fx(x, inputs_t[i], Time_t[i])
+            X.append(x)
+        return (x, *self.observe(X.stack()))
+
+    def rollout_online(self, x, start, end, inputs, Time):
+        """
+        Rollout of the state transitions for steps in [start, end) with online interpolation of the inputs
+        between consecutive steps. The interval after the last step holds the last input and continues the last
+        time increment, see extrapolate.
+        :param x: (torch.Tensor, shape=[batchsize, nx]) State at step start
+        :param inputs: (torch.Tensor, shape=[batchsize, nsteps + 1, dim]) Extrapolated inputs of the ODE system
+        :param Time: (torch.Tensor, shape=[batchsize, nsteps + 1, 1]) Extrapolated time of each step
+        :return: (tuple) State at step end, and X, Y of the steps
+        """
+        X = StepBuffer(end - start)
+        # the two step windows of all steps are views of a single unfold instead of a slice per step
+        inputs_w = inputs[:, start:end + 1].unfold(1, 2, 1).transpose(2, 3).unbind(1)
+        Time_w = Time[:, start:end + 1].unfold(1, 2, 1).transpose(2, 3).unbind(1)
+        for i in range(end - start):
+            x = self.fx(x, inputs_w[i], Time_w[i])
+            X.append(x)
+        return (x, *self.observe(X.stack()))
 
 
 def _extract_dims(datadims):
@@ -466,9 +792,11 @@ def _extract_dims(datadims):
 
 def block_model(kind, datadims, linmap, nonlinmap, bias, n_layers=2, fe=None, fyu=None,
               activation=nn.GELU, residual=False, linargs=dict(),
-              xou=torch.add, xod=torch.add, xoe=torch.add, xoyu=torch.add, name='blockmodel', input_key_map={}):
+              xou=torch.add, xod=torch.add, xoe=torch.add, xoyu=torch.add, name='blockmodel', input_key_map={},
+              compiled=False, checkpoint_segments=0):
     """
     Helper function that generates a block-structured SSM with the same structure used across fx, fy, fu, and fd.
+    The compiled and checkpoint_segments options are passed on to BlockSSM.
     """
     assert kind in _bssm_kinds, \
         f"Unrecognized model kind {kind}; supported models are {_bssm_kinds}"
@@ -522,16 +850,19 @@ def block_model(kind, datadims, linmap, nonlinmap, bias, n_layers=2, fe=None, fy
     ) if fyu is not None else None
 
     model = BlockSSM(fx, fy, fu=fu, fd=fd, fe=fe, fyu=fyu, xoyu=xoyu, xou=xou, xod=xod, xoe=xoe, name=name,
-                 input_key_map=input_key_map, residual=residual)
+                 input_key_map=input_key_map, residual=residual, compiled=compiled,
+                     checkpoint_segments=checkpoint_segments)
 
     return model
 
 
 def blackbox_model(datadims, linmap, nonlinmap, bias, n_layers=2, fe=None, fyu=None,
              activation=nn.GELU, linargs=dict(),
-             xoyu=torch.add, xoe=torch.add, input_key_map={}, name='blackbox_model', extra_inputs=[]):
+             xoyu=torch.add, xoe=torch.add, input_key_map={}, name='blackbox_model', extra_inputs=[],
+             compiled=False, checkpoint_segments=0):
     """
-    Helper function that generates a black box state space model.
+    Helper function that generates a black box state space model. The compiled and checkpoint_segments options are
+    passed on to BlackSSM.
     """
     nx, ny, nu, nd = _extract_dims(datadims)
     hsizes = [nx] * n_layers
@@ -545,7 +876,8 @@ def blackbox_model(datadims, linmap, nonlinmap, bias, n_layers=2, fe=None, fyu=N
     fy = linmap(nx, ny, bias=bias, linargs=linargs)
 
     model = BlackSSM(fx, fy, fe=fe, fyu=fyu, xoyu=xoyu, xoe=xoe, name=name,
-                     input_key_map=input_key_map, extra_inputs=extra_inputs)
+                     input_key_map=input_key_map, extra_inputs=extra_inputs, compiled=compiled,
+                     checkpoint_segments=checkpoint_segments)
     return model
 
 
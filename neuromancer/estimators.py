@@ -73,10 +73,20 @@ class TimeDelayEstimator(Component):
             elif len(data[k].shape) == 3:
                 assert data[k].shape[1] >= self.nsteps, \
                     f'Sequence too short for estimator calculation. Should be at least {self.nsteps}'
-                featlist.append(data[k][:, self.nsteps - self.window_size:self.nsteps, :].reshape(data[k].shape[0], -1))
+                featlist.append(data[k][:, self.nsteps - self.window_size:self.nsteps, :])
             else:
                 raise ValueError(f'Input {k} has {len(data[k].shape)} dimensions. Should have 2 or 3 dimensions')
-        features = torch.cat(featlist, dim=1)
+        nsamples = featlist[0].shape[0]
+        if len(featlist) == 1:
+            return featlist[0].reshape(nsamples, -1)
+        # windows are copied straight into their columns of the feature vector instead of being
+        # flattened into temporaries which are then concatenated
+        features = featlist[0].new_empty(nsamples, sum(f[0].numel() for f in featlist))
+        start = 0
+        for f in featlist:
+            end = start + f[0].numel()
+            features[:, start:end].view(f.shape).copy_(f)
+            start = end
         return features
 
     def forward(self, data):
@@ -101,12 +111,13 @@ class FullyObservable(TimeDelayEstimator):
         super().__init__(data_dims, nsteps=nsteps, window_size=window_size,
                          input_keys=input_keys, name=name)
         self.net = nn.Identity()
+        self.register_buffer('_zero_reg', torch.zeros(()), persistent=False)
 
     def features(self, data):
         return data[self.input_keys[0]][:, self.nsteps-1, :]
 
     def reg_error(self):
-        return torch.tensor(0.0)
+        return self._zero_reg
 
 
 class FullyObservableAugmented(FullyObservable):
@@ -123,9 +134,10 @@ class FullyObservableAugmented(FullyObservable):
         self.d0 = d0   # fixed initial conditions of the augmented state
 
     def features(self, data):
-        nsamples, ny = data['Yp'][:, 0, :].shape
-        augmented_state = self.d0*torch.ones([nsamples, self.nd])
-        return torch.cat([data['Yp'][:, self.nsteps - 1, :], augmented_state], 1)
+        Yp = data['Yp']
+        # filled directly with d0 on the device of the data instead of scaling a tensor of ones
+        augmented_state = Yp.new_full((Yp.shape[0], self.nd), self.d0)
+        return torch.cat([Yp[:, self.nsteps - 1, :], augmented_state], 1)
 
 
 class LinearEstimator(TimeDelayEstimator):
@@ -146,13 +158,15 @@ class MLPEstimator(TimeDelayEstimator):
     """
     def __init__(self, data_dims, nsteps=1, window_size=1, bias=False,
                  linear_map=slim.Linear, nonlin=nn.GELU, hsizes=[64],
-                 input_keys=['Yp'], linargs=dict(), name='MLP_estim'):
+                 input_keys=['Yp'], linargs=dict(), name='MLP_estim', compiled=False):
         """
         See base class for arguments
+        :param compiled: (bool) Compile the network with torch.compile, see blocks.MLP
         """
         super().__init__(data_dims, nsteps=nsteps, window_size=window_size, input_keys=input_keys, name=name)
         self.net = blocks.MLP(self.in_features, self.out_features, bias=bias,
-                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs)
+                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs,
+                              compiled=compiled)
 
 
 class MLPAugmentedEstimator(MLPEstimator):
@@ -161,15 +175,17 @@ class MLPAugmentedEstimator(MLPEstimator):
     """
     def __init__(self, data_dims, nsteps=1, window_size=1, bias=False,
                  linear_map=slim.Linear, nonlin=nn.GELU, hsizes=[64],
-                 input_keys=['Yp'], linargs=dict(), name='MLP_estim'):
+                 input_keys=['Yp'], linargs=dict(), name='MLP_estim', compiled=False):
         """
         See base class for arguments
+        :param compiled: (bool) Compile the network with torch.compile, see blocks.MLP
         """
         super().__init__(data_dims, nsteps=nsteps, window_size=window_size, bias=bias,
                          linear_map=linear_map, nonlin=nonlin, hsizes=hsizes,
                          input_keys=input_keys, linargs=linargs, name=name)
         self.net = blocks.MLP(self.in_features, self.nx - self.ny, bias=bias,
-                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs)
+                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs,
+                              compiled=compiled)
 
     def forward(self, data):
         X = data[self.input_keys[0]][:, self.nsteps - 1, :]
@@ -184,13 +200,15 @@ class ResMLPEstimator(TimeDelayEstimator):
     """
     def __init__(self, data_dims, nsteps=1, window_size=1, bias=False,
                  linear_map=slim.Linear, nonlin=nn.GELU, hsizes=[64],
-                 input_keys=['Yp'], linargs=dict(), name='ResMLP_estim'):
+                 input_keys=['Yp'], linargs=dict(), name='ResMLP_estim', compiled=False):
         """
         see base class for arguments
+        :param compiled: (bool) Compile the network with torch.compile, see blocks.ResMLP
         """
         super().__init__(data_dims, nsteps=nsteps, window_size=window_size, input_keys=input_keys, name=name)
         self.net = blocks.ResMLP(self.in_features, self.out_features, bias=bias,
-                                 linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs)
+                                 linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs,
+                                 compiled=compiled)
 
 
 class RNNEstimator(TimeDelayEstimator):
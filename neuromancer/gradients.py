@@ -11,16 +11,19 @@ from neuromancer.component import Component
 def gradient(y, x, grad_outputs=None, create_graph=True):
     """
     Compute gradients dy/dx
+    Gradients with respect to several inputs of the same forward pass should be requested together by passing a
+    list of inputs, which walks the graph once instead of once per input with retain_graph=True.
     :param y: [tensors] outputs
-    :param x: [tensors] inputs
+    :param x: [tensors] input, or list of inputs
     :param grad_outputs:
-    :return:
+    :return: gradient, or list of gradients when x is a list
     """
     if grad_outputs is None:
         grad_outputs = torch.ones_like(y)
-    grad = torch.autograd.grad(y, [x], grad_outputs=grad_outputs,
-                               create_graph=create_graph)[0]
-    return grad
+    inputs = list(x) if isinstance(x, (list, tuple)) else [x]
+    grads = torch.autograd.grad(y, inputs, grad_outputs=grad_outputs,
+                                create_graph=create_graph)
+    return list(grads) if isinstance(x, (list, tuple)) else grads[0]
 
 
 def jacobian(y, x):
@@ -31,12 +34,13 @@ def jacobian(y, x):
     :param x: tensor] inputs
     :return:
     """
-    jac = torch.zeros(y.shape[0], x.shape[0])
-    for i in range(y.shape[0]):
-        grad_outputs = torch.zeros_like(y)
-        grad_outputs[i] = 1
-        jac[i] = gradient(y, x, grad_outputs=grad_outputs, create_graph=True)
-    return jac
+    # all rows of the jacobian in one vmapped backward pass instead of one backward pass per output
+    m = y.shape[0]
+    grad_outputs = torch.eye(m, dtype=y.dtype, device=y.device)
+    grad_outputs = grad_outputs.reshape(m, m, *[1]*(y.dim() - 1)).expand(m, *y.shape)
+    jac = torch.autograd.grad(y, [x], grad_outputs=grad_outputs,
+                              create_graph=True, is_grads_batched=True)[0]
+    return jac.reshape(m, x.shape[0])
 
 
 class Gradient(Component):
@@ -138,7 +138,7 @@ class GraphTimestepper(SSM):
         :param data: [{"x0": Tensor, "Yf": Tensor}]
         :return: ["reg_error": Tensor, "latent_state": Tensor, "Y_pred": Tensor]
         """
-        nsteps = data[self.input_key_map['Yf']].shape[1]
+        nsteps = data[self._k_Yf].shape[1]
 
         X = self.preprocessor(data)
         batch = X.pop('batch', None)
@@ -148,7 +148,7 @@ class GraphTimestepper(SSM):
         add_outputs = X
 
         if self.separate_batch_dim: #(batch, nodes, timesteps, ...)
-            nsteps = data[self.input_key_map['Yf']].shape[1]
+            nsteps = data[self._k_Yf].shape[1]
             batch_size, num_nodes = node_attr.shape[:2]
             num_edges = edge_attr.shape[1]
             node_attr, edge_attr, edge_index, batch = self._collate(node_attr, edge_attr, edge_index)
@@ -163,18 +163,18 @@ class GraphTimestepper(SSM):
             G = self.process(G, edge_index, *[data[key][:,h] for key in self.fx_keys])
             X.append(G)
 
-        #Decode
-        Y=[]
-        for x in X[1:]:
-            Y.append(self.decode(x))
-
-        Y=torch.stack(Y, dim=1)
+        #Decode all steps in a single decoder call on the stacked latent node states
         X=torch.stack([x['node_attr'] for x in X], dim=0)
+        Y=self.decode({'node_attr': X[1:].flatten(0, 1)}).unflatten(0, (nsteps, X.shape[1]))
         X=X.reshape(X.shape[0],-1)
 
         if self.separate_batch_dim:
-            Y = Y.reshape(batch_size, num_nodes, nsteps, self.out_size).permute(0,2,1,3).squeeze(-1)
+            Y = Y.unflatten(1, (batch_size, num_nodes)).transpose(0, 1).squeeze(-1)
             X = X.reshape(batch_size, num_nodes, nsteps+1, self.latent_size).permute(0,2,1,3).reshape(batch_size, nsteps+1, -1)
+        else:
+            Y = Y.transpose(0, 1)
+        #Decoded time major, one copy to batch major so losses against the batch major targets read contiguous memory
+        Y = Y.contiguous()
 
         out = {f'Y_pred_{self.name}': Y, 
                f'X_pred_{self.name}': X,
@@ -263,6 +263,3 @@ class GraphTimestepper(SSM):
         edge_attr = torch.reshape(edge_attr, (batch_size, num_edges, -1))
         edge_index = edge_index[:, :num_edges]
         return node_attr, edge_attr, edge_index
-
-    def reg_error(self):
-        return sum([k.reg_error() for k in self.children() if hasattr(k, 'reg_error')])
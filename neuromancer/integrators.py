@@ -131,8 +131,10 @@ class Euler_Trap(Integrator):
         :param x: (torch.Tensor, shape=[batchsize, SysDim])
         :return x_{t+1}: (torch.Tensor, shape=[batchsize, SysDim])
         """
-        pred = x + self.h * self.block(self.state(x, t, t, u))
-        corr = x + 0.5 * self.h * (self.block(self.state(x, t, t, u)) + self.block(self.state(pred, self.h+t, t, u)))
+        # f(x_i) is shared by the predictor and the corrector
+        k1 = self.block(self.state(x, t, t, u))
+        pred = x + self.h * k1
+        corr = x + 0.5 * self.h * (k1 + self.block(self.state(pred, self.h+t, t, u)))
         return corr
 
 
@@ -205,8 +207,8 @@ class RK4_Trap(Integrator):
         k3 = self.block(self.state(x + self.h*k2/2.0, t + self.h/2, t, u))   # k3 = f(x_i + 0.5*h*k2, t_i + 0.5*h)
         k4 = self.block(self.state(x + self.h*k3, t + self.h, t, u))         # k4 = f(y_i + h*k3, t_i + h)
         pred = x + self.h*(k1/6.0 + k2/3.0 + k3/3.0 + k4/6.0)
-        corr = x + 0.5*self.h*(self.block(self.state(x, t, t, u)) +
-                               self.block(self.state(pred, t + self.h, t, u)))
+        # the corrector reuses k1 = f(x_i) rather than evaluating it again
+        corr = x + 0.5*self.h*(k1 + self.block(self.state(pred, t + self.h, t, u)))
         return corr
 
 
@@ -290,7 +292,7 @@ class Runge_Kutta_Fehlberg(Integrator):
 
 
 class MultiStep_PredictorCorrector(Integrator):
-    def __init__(self, block, interp_u=None, h=1.0):
+    def __init__(self, block, interp_u=None, h=1.0, batched_block=False):
         """
         :param block: (nn.Module) A state transition model.
         :param interp_u: Function for interpolating control input values for intermediate integration steps.
@@ -299,8 +301,12 @@ class MultiStep_PredictorCorrector(Integrator):
                          See interpolation.py and neuromancer/examples/system_identifcation/duffing_parameter.py for
                          more sophisticated interpolation schemes.
         :param h: (float) integration step size
+        :param batched_block: (bool) Evaluate the block on the four window states in a single call with the window
+                              stacked along the batch dimension. Only valid for blocks which treat samples
+                              independently, e.g. no batch normalization.
         """
         super().__init__(block=block, interp_u=interp_u, h=h)
+        self.batched_block = batched_block
 
     def integrate(self, x, u, t):
         """
@@ -313,21 +319,18 @@ class MultiStep_PredictorCorrector(Integrator):
         :return x_{t+1}: (torch.Tensor, shape=[batchsize, SysDim])
         """
         assert x.shape[0] == 4, "This four-step method requires x.shape[0] = 4."
-        x0 = x[0, :, :]
-        x1 = x[1, :, :]
-        x2 = x[2, :, :]
         x3 = x[3, :, :]     # current state
+        # derivatives at the window states are shared by the predictor and the corrector
+        states = [self.state(x[k, :, :], t - self.h*(3 - k), t, u) for k in range(4)]
+        if self.batched_block:
+            f0, f1, f2, f3 = self.block(torch.cat(states, dim=0)).chunk(4, dim=0)
+        else:
+            f0, f1, f2, f3 = [self.block(state) for state in states]
         # Predictor: linear multistep Adams–Bashforth method (explicit)
-        x4_pred = x3 + self.h*(55/24*self.block(self.state(x3, t, t, u)) -
-                               59/24*self.block(self.state(x2, t-self.h, t, u)) +
-                               37/24*self.block(self.state(x1, t-self.h*2, t, u)) -
-                               9/24*self.block(self.state(x0, t-self.h*3, t, u))) 
+        x4_pred = x3 + self.h*(55/24*f3 - 59/24*f2 + 37/24*f1 - 9/24*f0)
         # Corrector: linear multistep Adams–Moulton method (implicit)
         x4_corr = x3 + self.h*(251/720*self.block(self.state(x4_pred, t+self.h, t, u)) +
-                               646/720*self.block(self.state(x3, t, t, u)) -
-                               264/720*self.block(self.state(x2, t-self.h, t, u)) +
-                               106/720*self.block(self.state(x1, t-2*self.h, t, u)) -
-                               19/720*self.block(self.state(x0, t-3*self.h, t, u)))
+                               646/720*f3 - 264/720*f2 + 106/720*f1 - 19/720*f0)
         return x4_corr  # (overlapse moving windows #, state dim) -> 2D tensor
 
 
@@ -12,6 +12,23 @@ import numbers
 import numpy as np
 
 
+def scalars_to_host(tensors):
+    """
+    Copy scalar tensors to Python numbers with one device to host transfer per device instead of a
+    synchronizing .item() call per tensor.
+
+    :param tensors: (dict {str: torch.Tensor}) Tensors with a single element
+    :return: (dict {str: number})
+    """
+    by_device = {}
+    for k, v in tensors.items():
+        by_device.setdefault(v.device, []).append(k)
+    values = {}
+    for keys in by_device.values():
+        values.update(zip(keys, torch.stack([tensors[k].detach().reshape(()) for k in keys]).tolist()))
+    return values
+
+
 class BasicLogger:
     def __init__(self, args=None, savedir='test', verbosity=10,
                  stdout=('nstep_dev_loss', 'loop_dev_loss', 'best_loop_dev_loss',
@@ -63,12 +80,13 @@ class BasicLogger:
         if step % self.verbosity == 0:
             elapsed_time = time.time() - self.start_time
             entries = [f'epoch: {step}']
+            scalars = scalars_to_host({k: v for k, v in output.items() if k in self.stdout
+                                       and isinstance(v, torch.Tensor) and torch.numel(v) == 1})
             for k, v in output.items():
-                try:
-                    if k in self.stdout:
-                        entries.append(f'{k}: {v.item():.5f}')
-                except (ValueError, AttributeError) as e:
-                    pass
+                if k in scalars:
+                    entries.append(f'{k}: {scalars[k]:.5f}')
+                elif k in self.stdout and isinstance(v, np.ndarray) and v.size == 1:
+                    entries.append(f'{k}: {v.item():.5f}')
             entries.append(f'eltime: {elapsed_time: .5f}')
             print('\t'.join([e for e in entries if 'reg_error' not in e]))
 
@@ -132,7 +150,8 @@ class MLFlowLogger(BasicLogger):
 
     def log_metrics(self, output, step=0):
         """
-        Record metrics to mlflow
+        Record metrics to mlflow. Scalars are collected and sent in a single log_batch request
+        instead of one tracking call per metric.
 
         :param output: (dict {str: tensor}) Will only record 0d torch.Tensors (scalars)
         :param step: (int) Epoch of training
@@ -147,14 +166,16 @@ class MLFlowLogger(BasicLogger):
                         keys.append(k)
         else:
             keys = _keys
+        metrics = scalars_to_host({k: output[k] for k in keys
+                                   if isinstance(output[k], torch.Tensor) and torch.numel(output[k]) == 1})
         for k in keys:
             v = output[k]
-            if isinstance(v, torch.Tensor) and torch.numel(v) == 1:
-                mlflow.log_metric(k, v.item())
-            elif isinstance(v, np.ndarray) and v.size == 1:
-                mlflow.log_metric(k, v.flatten())
+            if isinstance(v, np.ndarray) and v.size == 1:
+                metrics[k] = v.item()
             elif isinstance(v, numbers.Number):
-                mlflow.log_metric(k, v)
+                metrics[k] = v
+        if metrics:
+            mlflow.log_metrics(metrics, step=step)
 
     def log_artifacts(self, artifacts=dict()):
         """
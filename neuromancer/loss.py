@@ -67,7 +67,7 @@ class AggregateLoss(nn.Module, ABC):
             output = objective(input_dict)
             if isinstance(output, torch.Tensor):
                 output = {objective.output_keys[0]: output}
-            output_dict = {**output_dict, **output}
+            output_dict.update(output)
             loss += output_dict[objective.output_keys[0]]
         output_dict['objective_loss'] = loss
         return output_dict
@@ -84,7 +84,7 @@ class AggregateLoss(nn.Module, ABC):
         for c in self.constraints:
             # get loss, values, and violations of constraint via its forward pass
             output = c(input_dict)
-            output_dict = {**output_dict, **output}
+            output_dict.update(output)
             loss += output[c.output_keys[0]]
             cvalue = output[c.output_keys[1]]
             cviolation = output[c.output_keys[2]]
@@ -134,7 +134,7 @@ class PenaltyLoss(AggregateLoss):
         input_dict = {**input_dict, **objectives_dict}
         fx = objectives_dict['objective_loss']
         penalties_dict = self.calculate_constraints(input_dict)
-        input_dict = {**input_dict, **penalties_dict}
+        input_dict.update(penalties_dict)
         penalties = penalties_dict['penalty_loss']
         input_dict['loss'] = fx + penalties
         return input_dict
@@ -256,7 +256,7 @@ class AugmentedLagrangeLoss(AggregateLoss):
         input_dict['loss'] = fx
 
         con_dict = self.calculate_constraints(input_dict)
-        input_dict = {**input_dict, **con_dict}
+        input_dict.update(con_dict)
         C = con_dict['C_values']
         C_violations = con_dict['C_violations']
         scaled_penalty_loss = con_dict['penalty_loss']
@@ -435,26 +435,41 @@ class Animator:
         Writer = animation.writers['ffmpeg']
         self.writer = Writer(fps=15, metadata=dict(artist='Aaron Tuor'), bitrate=1800)
         self.ims = []
+        self._source, self._searched = None, False
 
-    def _find_mat(self, module):
+    @staticmethod
+    def _is_square_map(module):
         try:
-            mat = module.effective_W().detach().cpu().numpy()
-            if len(set(mat.shape)) != 1:
-                raise AttributeError
-            return mat
+            return len(set(module.effective_W().shape)) == 1
         except AttributeError:
-            for modus in module.children():
-                return self.find_mat(modus)
-            return np.eye(4)
+            return False
+
+    def _find_source(self, model):
+        """
+        Walk down the first-child chain of the model for a module with a square effective_W,
+        preferring a module's fx map over the module itself.
+
+        :param model: (nn.Module)
+        :return: (nn.Module or None)
+        """
+        module = model
+        while module is not None:
+            fx = getattr(module, 'fx', None)
+            if fx is not None and self._is_square_map(fx):
+                return fx
+            if self._is_square_map(module):
+                return module
+            module = next(module.children(), None)
+        return None
 
     def find_mat(self, model):
-        try:
-            mat = model.fx.effective_W().detach().cpu().numpy()
-            if len(set(mat.shape)) != 1:
-                raise AttributeError
-            return mat
-        except AttributeError:
-            return self._find_mat(model)
+        # the model structure does not change between frames, so the search runs once and
+        # every later frame is a single device to host copy of the weights
+        if not self._searched:
+            self._source, self._searched = self._find_source(model), True
+        if self._source is None:
+            return np.eye(4)
+        return self._source.effective_W().detach().cpu().numpy()
 
     def __call__(self):
         mat = self.find_mat(self.model)
@@ -472,6 +487,7 @@ class Animator:
 """
 
 
+@torch.no_grad()
 def plot_solution_mpp(model, xmin=-2, xmax=2, save_path=None):
     """
     plots solution landscape for problem with 2 parameters and 1 decision variable
@@ -500,6 +516,7 @@ def plot_solution_mpp(model, xmin=-2, xmax=2, save_path=None):
         plt.savefig(save_path+'/solution.pdf')
 
 
+@torch.no_grad()
 def plot_loss_mpp(model, dataset, xmin=-2, xmax=2, save_path=None):
     """
     plots loss function for multiparametric problem with 2 parameters
@@ -522,7 +539,8 @@ def plot_loss_mpp(model, dataset, xmin=-2, xmax=2, save_path=None):
             # check loss
             X = torch.stack([x[[i]], y[[j]]]).reshape(1,1,-1)
             dataset_plt['theta'] = X
-            step = model(dataset_plt)
+            with torch.set_grad_enabled(model.grad_inference):
+                step = model(dataset_plt)
             Loss[i,j] = step[name+'_loss'].detach().numpy()
 
     fig, ax = plt.subplots(subplot_kw={"projection": "3d"})
@@ -542,6 +560,7 @@ def plot_loss_mpp(model, dataset, xmin=-2, xmax=2, save_path=None):
     Double Integrator DPC example plots
 """
 
+@torch.no_grad()
 def plot_loss_DPC(model, policy, A, B, dataset, xmin=-5, xmax=5, save_path=None):
     """
     plot loss function for trained DPC model
@@ -574,7 +593,8 @@ def plot_loss_DPC(model, policy, A, B, dataset, xmin=-5, xmax=5, save_path=None)
             if nsteps == 1:
                 dataset_plt['Yp'] = X
                 dataset_plt['Yf'] = dataset_plt['Yf'][[0],:,:]
-                step = model(dataset_plt)
+                with torch.set_grad_enabled(model.grad_inference):
+                    step = model(dataset_plt)
                 Loss[i,j] = step[name+'_loss'].detach().numpy()
             # check contraction
             x0 = X[:,0,:].view(1, X.shape[-1])
@@ -643,6 +663,7 @@ def plot_loss_DPC(model, policy, A, B, dataset, xmin=-5, xmax=5, save_path=None)
         plt.savefig(save_path+'/contraction_regions.pdf')
 
 
+@torch.no_grad()
 def plot_policy(net, xmin=-5, xmax=5, save_path=None):
     x = torch.arange(xmin, xmax, 0.1)
     y = torch.arange(xmin, xmax, 0.1)
@@ -663,6 +684,7 @@ def plot_policy(net, xmin=-5, xmax=5, save_path=None):
         plt.savefig(save_path+'/policy.pdf')
 
 
+@torch.no_grad()
 def plot_policy_train(A, B, policy, policy_list, xmin=-5, xmax=5, save_path=None):
     # Writer = animation.writers['ffmpeg']
     Writer = animation.PillowWriter
@@ -709,6 +731,7 @@ def plot_policy_train(A, B, policy, policy_list, xmin=-5, xmax=5, save_path=None
     # ani.save(save_path + '/policy_animation_train.gif', writer='imagemagick')
 
 
+@torch.no_grad()
 def cl_simulate(A, B, net, nstep=50, x0=np.ones([2, 1])):
     """
 
@@ -801,11 +824,10 @@ def lpv_batched(fx, x):
         zeros = Ax == 0
         lambda_h = nlin(Ax) / Ax  # activation scaling
         lambda_h[zeros] = 0.
-        lambda_h_mats = [torch.diag(v) for v in lambda_h]
-        activation_mats += lambda_h_mats
-        lambda_h_mats = torch.stack(lambda_h_mats)
+        activation_mats += list(torch.diag_embed(lambda_h))
         x_layer = Ax * lambda_h
-        Aprime = torch.matmul(A, lambda_h_mats)
+        # scaling the columns of A by the diagonal activation matrices
+        Aprime = A * lambda_h.unsqueeze(-2)
         Aprime_mats += [Aprime]
         bprime = lambda_h * b
         bprimes += [bprime]
@@ -75,7 +75,8 @@ class Policy(Component):
                 featlist.append(data[k][:, :self.nsteps, :].reshape(data[k].shape[0], -1))
             else:
                 raise ValueError(f"Input {k} has {len(data[k].shape)} dimensions. Should have 2 or 3 dimensions")
-        return torch.cat(featlist, dim=1)
+        # torch.cat always copies, a single feature tensor can be used as is
+        return featlist[0] if len(featlist) == 1 else torch.cat(featlist, dim=1)
 
     def forward(self, data):
         """
@@ -165,28 +166,32 @@ class LinearPolicy(Policy):
 class MLPPolicy(Policy):
     def __init__(self, data_dims, nsteps=1, bias=True,
                  linear_map=slim.Linear, nonlin=nn.GELU, hsizes=[64],
-                 input_keys=["x0"], linargs=dict(), name="MLP_policy"):
+                 input_keys=["x0"], linargs=dict(), name="MLP_policy", compiled=False):
         """
 
         See LinearPolicy for arguments
+        :param compiled: (bool) Compile the network with torch.compile. Dictionary handling stays in eager mode
+                         so the compiled graph has a fixed tensor in, tensor out signature.
         """
         super().__init__(data_dims, nsteps=nsteps, input_keys=input_keys, name=name)
         self.net = blocks.MLP(insize=self.in_features, outsize=self.out_features, bias=bias,
-                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs)
+                              linear_map=linear_map, nonlin=nonlin, hsizes=hsizes, linargs=linargs,
+                              compiled=compiled)
 
 class MLP_boundsPolicy(Policy):
     def __init__(self, data_dims, nsteps=1, bias=True,
                  linear_map=slim.Linear, nonlin=nn.GELU, hsizes=[64],
                  min=0.0, max=1.0, method='sigmoid_scale',
-                 input_keys=["x0"], linargs=dict(), name="MLP_policy"):
+                 input_keys=["x0"], linargs=dict(), name="MLP_policy", compiled=False):
         """
 
         See LinearPolicy for arguments
+        :param compiled: (bool) Compile the network with torch.compile, see MLPPolicy
         """
         super().__init__(data_dims, nsteps=nsteps, input_keys=input_keys, name=name)
         self.net = blocks.MLP_bounds(insize=self.in_features, outsize=self.out_features, bias=bias,
                               linear_map=linear_map, nonlin=nonlin, hsizes=hsizes,
-                              min=min, max=max, method=method, linargs=linargs)
+                              min=min, max=max, method=method, linargs=linargs, compiled=compiled)
 
 
 class RNNPolicy(Policy):
@@ -207,11 +212,11 @@ class RNNPolicy(Policy):
         :param data: (dict {str: torch.tensor)}
         :return: (dict {str: torch.tensor)}
         """
+        # static inputs are broadcast over the horizon as views, the outer cat makes the only copy
         features = torch.cat([
             *[data[k][:, :self.nsteps, :] for k in self.input_keys if len(data[k].shape) == 3],
-            *[torch.cat([data[k] for _ in range(self.nsteps)], dim=1).reshape(data[k].shape[0], self.nsteps, data[k].shape[1])
+            *[data[k].unsqueeze(1).expand(-1, self.nsteps, -1)
               for k in self.input_keys if len(data[k].shape) == 2]], dim=-1)
-        print('features', features.shape)
         Uf = self.net(features).reshape(features.shape[0], self.nsteps, -1)
         output = {name: tensor for tensor, name
                   in zip([Uf, self.net.reg_error()], self.output_keys)}
@@ -68,11 +68,13 @@ class Problem(nn.Module):
         return {f'{data["name"]}_{k}': v for k, v in output_dict.items()}
 
     def step(self, input_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        # copy once so the caller's batch is untouched, then merge component outputs in place
+        input_dict = dict(input_dict)
         for component in self.components:
             output_dict = component(input_dict)
             if isinstance(output_dict, torch.Tensor):
                 output_dict = {component.name: output_dict}
-            input_dict = {**input_dict, **output_dict}
+            input_dict.update(output_dict)
         return input_dict
 
     def graph(self, include_objectives=True):
@@ -46,18 +46,18 @@ def pwa_batched(fx, x, use_bias=True):
         sigma_null_space = nlin(torch.zeros(z.shape[-1]))     # sigma(0)
         lambda_vec = (nlin(z) - sigma_null_space) / z  # activation scaling vector
         lambda_vec[z == 0] = 0.                     # fixing division by zero
-        Lambda = torch.stack([torch.diag(v) for v in lambda_vec])  # activation scaling matrix Lambda
+        Lambda = torch.diag_embed(lambda_vec)  # activation scaling matrix Lambda
         Lambdas.append(Lambda)
 
         # layer transform:  Lambda*(A*x + b) + sigma(0)
         x_layer = z * lambda_vec + sigma_null_space
 
-        # A' = Lambda*A
-        Aprime = torch.matmul(A, Lambda)
+        # A' = Lambda*A, a diagonal Lambda scales the columns of A, no need for a dense matmul
+        Aprime = A * lambda_vec.unsqueeze(-2)
         Aprime_mats += [Aprime]
 
         # b' = Lambda*b + sigma(0)
-        bprime = torch.matmul(b, Lambda) + sigma_null_space
+        bprime = b * lambda_vec + sigma_null_space
         bprimes += [bprime]
 
         if iter == 0:
@@ -95,14 +95,12 @@ def lpv_batched(fx, x, use_bias=False):
         lambda_h = nlin(Ax) / Ax  # activation scaling
         lambda_h[zeros] = 0.
 
-        lambda_h_mats = [torch.diag(v) for v in lambda_h]
-        activation_mats += lambda_h_mats
-        lambda_h_mats = torch.stack(lambda_h_mats)
+        activation_mats += list(torch.diag_embed(lambda_h))
 
         x_layer = Ax * lambda_h
 
-        Aprime = torch.matmul(A, lambda_h_mats)
-        # Aprime = A * lambda_h
+        # scaling the columns of A by the diagonal activation matrices
+        Aprime = A * lambda_h.unsqueeze(-2)
         Aprime_mats += [Aprime]
 
         bprime = lambda_h * b
@@ -73,7 +73,8 @@ class OpenLoopSimulator(Simulator):
         )
 
     def simulate(self, data):
-        return self.model(move_batch_to_device(data, self.device))
+        with torch.set_grad_enabled(self.model.grad_inference):
+            return self.model(move_batch_to_device(data, self.device))
 
 
 class MHOpenLoopSimulator(Simulator):
@@ -101,19 +102,28 @@ class MHOpenLoopSimulator(Simulator):
         Y, X, L = [], [], []
         Yp, Yf, Xp, Xf = [], [], [], []
         data = move_batch_to_device(data, self.device)
-        yN = data['Yp'][:, :self.dataset.nsteps, :]
+        window_size = self.dataset.nsteps
+        # mirrored ring buffer: each prediction is written at position s and s + window_size,
+        # so the latest window_size outputs are always the contiguous view window[:, s:s + window_size]
+        window = data['Yp'][:, :window_size, :].repeat(1, 2, 1)
         nsim = data['Yp'].shape[0]
         for i in range(nsim-self.nsteps):
+            start = i % window_size
             step_data = self.horizon_data(data, i)
-            step_data['Yp'] = yN
+            step_data['Yp'] = window[:, start:start + window_size, :]
             step_output = self.model(step_data)
             # outputs
             y_key = [k for k in step_output.keys() if 'Y_pred' in k][0]
             y = step_output[y_key][:, 0:1, :]
             Y.append(y)
-            yN = torch.cat([yN, y], dim=1)[:, 1:, :]
+            if torch.is_grad_enabled():
+                # the window read by this step must stay unmodified for backward
+                window = window.clone()
+            window[:, start, :] = y[:, 0, :]
+            window[:, start + window_size, :] = y[:, 0, :]
             yp_key = [k for k in step_output.keys() if 'Yp' in k][0]
-            yp = step_output[yp_key][:, 0:1, :]
+            # copy, the window view is overwritten by later steps
+            yp = step_output[yp_key][:, 0:1, :].clone()
             Yp.append(yp)
             yf_key = [k for k in step_output.keys() if 'Yf' in k][0]
             yf = step_output[yf_key][:, 0:1, :]
@@ -186,9 +196,10 @@ class MultiSequenceOpenLoopSimulator(Simulator):
 
     def simulate(self, data):
         outputs = []
-        for d in data:
-            d = move_batch_to_device(d, self.device)
-            outputs.append(self.model(d))
+        with torch.set_grad_enabled(self.model.grad_inference):
+            for d in data:
+                d = move_batch_to_device(d, self.device)
+                outputs.append(self.model(d))
         return self.agg(outputs)
 
     def dev_eval(self):
@@ -210,6 +221,7 @@ class ClosedLoopSimulator:
             emulator_output_keys=None,
             emulator_input_keys=None,
             nsim=None,
+            grad_inference=False,
     ):
         """
 
@@ -218,6 +230,7 @@ class ClosedLoopSimulator:
         :param system_model: nn.Module
         :param estimator: nn.Module
         :param emulator: psl.EmulatorBase
+        :param grad_inference: (bool) Track gradients through the simulation, otherwise no autograd graph is built
         """
         assert isinstance(policy, nn.Module), \
             f'{type(policy)} is not nn.Module.'
@@ -238,6 +251,7 @@ class ClosedLoopSimulator:
         self.emulator_output_keys = emulator_output_keys
         # ['Uf', 'Df', 'x0']   - must be always in this order
         self.emulator_input_keys = emulator_input_keys
+        self.grad_inference = grad_inference
         key = list(sim_data.keys())[0]
         if nsim is None:
             self.nsim = sim_data[key].shape[1] - estimator.window_size - policy.nsteps
@@ -354,46 +368,49 @@ class ClosedLoopSimulator:
             start_k = self.estimator.window_size
         else:
             start_k = self.policy.nsteps
-        for k in range(start_k, start_k+nsim):
+        # the estimator and the plant are fixed for the whole simulation, so both branches are resolved once
+        if self.estimator is not None:
+            def estimate(k):
+                return self.estimator(self.step_data_estimator(self.sim_data, k))
+        else:
+            def estimate(k):
+                return {}
+        if use_emulator:
+            model, model_input_keys = self.step_emulator, self.emulator_input_keys
+        else:
+            model, model_input_keys = self.system_model, self.system_model.input_keys
+        with torch.set_grad_enabled(self.grad_inference):
+            for k in range(start_k, start_k+nsim):
 
-            # estimator step
-            if self.estimator is not None:
-                step_data = self.step_data_estimator(self.sim_data, k)
-                estim_out = self.estimator(step_data)
-            else:
-                estim_out = {}
+                # estimator step
+                estim_out = estimate(k)
 
-            # policy step
-            policy_in = self.step_data_policy(self.sim_data, k)
-            step_data = {**policy_in, **estim_out}
-            policy_out = self.policy(step_data)     # calculate n-step ahead control
-            policy_out = self.rhc(policy_out)       # apply reciding horizon control
+                # policy step
+                policy_in = self.step_data_policy(self.sim_data, k)
+                step_data = {**policy_in, **estim_out}
+                policy_out = self.policy(step_data)     # calculate n-step ahead control
+                policy_out = self.rhc(policy_out)       # apply reciding horizon control
 
-            # model step
-            if use_emulator:
-                step_data = self.step_data_model(self.sim_data, k, self.emulator_input_keys)
-                step_data = {**step_data, **estim_out, **policy_out}
-                model_out = self.step_emulator(step_data)
-            else:
-                step_data = self.step_data_model(self.sim_data, k, self.system_model.input_keys)
+                # model step
+                step_data = self.step_data_model(self.sim_data, k, model_input_keys)
                 step_data = {**step_data, **estim_out, **policy_out}
-                model_out = self.system_model(step_data)
-
-            # closed-loop step
-            cl_step_data = {**estim_out, **policy_in, **policy_out, **model_out}
-            # update sim_data for next step
-            self.sim_data = self.update_sim_data(self.sim_data, cl_step_data, k)
-
-            # process batch data to have 2 dimensions: time x var. dim.
-            for key in cl_step_data.keys():
-                if len(cl_step_data[key].shape) == 3:
-                    cl_step_data[key] = cl_step_data[key][:, 0, :]
-            # if nstep ahead policy: select only each n-th step of policy keys for logging
-            for key in self.policy.input_keys:
-                cl_step_data[key] = cl_step_data[key][::self.policy.nsteps, :]
-
-            # append closed-loop step to simulation data
-            cl_data = self.append_data(cl_data, cl_step_data)
+                model_out = model(step_data)
+
+                # closed-loop step
+                cl_step_data = {**estim_out, **policy_in, **policy_out, **model_out}
+                # update sim_data for next step
+                self.sim_data = self.update_sim_data(self.sim_data, cl_step_data, k)
+
+                # process batch data to have 2 dimensions: time x var. dim.
+                for key in cl_step_data.keys():
+                    if len(cl_step_data[key].shape) == 3:
+                        cl_step_data[key] = cl_step_data[key][:, 0, :]
+                # if nstep ahead policy: select only each n-th step of policy keys for logging
+                for key in self.policy.input_keys:
+                    cl_step_data[key] = cl_step_data[key][::self.policy.nsteps, :]
+
+                # append closed-loop step to simulation data
+                cl_data = self.append_data(cl_data, cl_step_data)
         # concatenate step data in a single tensor
         for key in cl_data.keys():
             cl_data[key] = torch.cat(cl_data[key])
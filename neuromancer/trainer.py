@@ -2,6 +2,7 @@
 
 
 """
+from collections import OrderedDict
 from copy import deepcopy
 
 import torch
@@ -14,7 +15,61 @@ from neuromancer.callbacks import Callback
 
 
 def move_batch_to_device(batch, device="cpu"):
-    return {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
+    # copies out of pinned host memory can run asynchronously and overlap with compute
+    return {k: v.to(device, non_blocking=v.is_pinned()) if isinstance(v, torch.Tensor) else v
+            for k, v in batch.items()}
+
+
+def prefetch_to_device(batches, device="cpu"):
+    """
+    Yield the batches of a loader on the device. On CUDA the copy of the next batch is issued on a side stream
+    before the current batch is handed out, so copies out of pinned host memory overlap with the compute on it.
+
+    :param batches: (iterable of dict) Batches, e.g. a DataLoader
+    :param device: (str or torch.device)
+    """
+    device = torch.device(device)
+    if device.type != "cuda":
+        for batch in batches:
+            yield move_batch_to_device(batch, device)
+        return
+    stream = torch.cuda.Stream(device)
+
+    def load(batch):
+        with torch.cuda.stream(stream):
+            return move_batch_to_device(batch, device)
+
+    batches = iter(batches)
+    batch = next(batches, None)
+    batch = load(batch) if batch is not None else None
+    while batch is not None:
+        current = torch.cuda.current_stream(device)
+        current.wait_stream(stream)
+        for v in batch.values():
+            if isinstance(v, torch.Tensor) and v.is_cuda:
+                # allocated on the side stream, keep the memory alive until the compute stream is done with it
+                v.record_stream(current)
+        following = next(batches, None)
+        following = load(following) if following is not None else None
+        yield batch
+        batch = following
+
+
+def _amp_supported(device, dtype=torch.float16):
+    """
+    Float16 mixed precision only pays off on GPUs with tensor cores (Volta and newer).
+    Bfloat16 runs on CPUs and on GPUs that support it natively (Ampere and newer).
+
+    :param device: (str or torch.device)
+    :param dtype: (torch.dtype) torch.float16 or torch.bfloat16
+    :return: (bool)
+    """
+    device = torch.device(device)
+    if dtype == torch.bfloat16:
+        return device.type == "cpu" or (device.type == "cuda" and torch.cuda.is_available()
+                                        and torch.cuda.is_bf16_supported())
+    return device.type == "cuda" and torch.cuda.is_available() \
+        and torch.cuda.get_device_capability(device)[0] >= 7
 
 
 class Trainer:
@@ -42,7 +97,14 @@ class Trainer:
         eval_metric="dev_loss",
         eval_mode="min",
         clip=100.0,
-        device="cpu"
+        device="cpu",
+        amp=False,
+        amp_dtype=torch.float16,
+        best_model_path=None,
+        compiled=False,
+        microbatch_size=None,
+        cache_dev_data=False,
+        snapshot_interval=1,
     ):
         """
 
@@ -54,8 +116,29 @@ class Trainer:
         :param patience: (int) Number of epochs to allow no improvement before early stopping
         :param warmup: (int) How many epochs to wait before enacting early stopping policy
         :param eval_metric: (str) Performance metric for model selection and early stopping
+        :param amp: (bool) Whether to train with float16 autocast and gradient scaling. Only enabled on CUDA devices
+                    with tensor cores (compute capability >= 7.0).
+        :param amp_dtype: (torch.dtype) Autocast dtype. torch.bfloat16 keeps the float32 exponent range so it needs no
+                          gradient scaling and is also enabled on CPU.
+        :param best_model_path: (str) Optional file for checkpointing the best state dict during training instead of
+                                keeping a copy in host memory. It is loaded back when training ends.
+        :param compiled: (bool or str) Run the training and validation passes through torch.compile(problem) with static
+                         shapes, and compile the gradient update. A string is passed as the torch.compile mode, e.g.
+                         'reduce-overhead' replays them as CUDA graphs. Parameters and state dicts are still taken from
+                         the uncompiled problem.
+        :param microbatch_size: (int) Optional number of samples per forward and backward pass. Training batches are
+                                sliced along their first dimension and the gradients of the slices are accumulated
+                                before the single optimizer step of the batch, which bounds activation memory.
+        :param cache_dev_data: (bool) Collate and move the validation batches to the device once and reuse them every
+                               epoch. Requires a validation loader that yields the same batches each pass.
+        :param snapshot_interval: (int) Only every snapshot_interval-th epoch is a candidate for the best model, which
+                                  bounds the state dict copies while the validation loss still improves every epoch.
+                                  Patience counts the epochs that do not improve on the best candidate, improving
+                                  epochs in between neither reset nor advance it.
         """
         self.model = problem
+        mode = compiled if isinstance(compiled, str) else None
+        self.compiled_model = torch.compile(problem, dynamic=False, mode=mode) if compiled else problem
         self.optimizer = optimizer
         self.train_data = train_data
         self.dev_data = dev_data
@@ -80,9 +163,28 @@ class Trainer:
         self.warmup = warmup
         self.badcount = 0
         self.clip = clip
-        self.best_devloss = np.finfo(np.float32).max if self._eval_min else 0.
-        self.best_model = deepcopy(self.model.state_dict())
+        self.microbatch_size = microbatch_size
+        self.cache_dev_data = cache_dev_data
+        self._dev_batches = None
+        self.snapshot_interval = snapshot_interval
         self.device = device
+        # kept on the device, so model selection reads a single flag from the host per epoch
+        self.best_devloss = torch.tensor(np.finfo(np.float32).max if self._eval_min else 0., device=device)
+        self.best_model_path = best_model_path
+        self.best_model = None
+        self._save_best()
+        # validation output of the best model, reused by test instead of another pass over the validation data
+        self._best_dev_output = None
+        self.amp = amp and _amp_supported(device, amp_dtype)
+        self.amp_dtype = amp_dtype
+        self.scaler = torch.amp.GradScaler("cuda", enabled=self.amp and amp_dtype == torch.float16)
+        # gradient clipping and the optimizer step are compiled as well unless float16 loss scaling is active,
+        # whose inf checks synchronize with the host
+        self.compiled_update = (
+            torch.compile(self.update, mode=mode)
+            if compiled and not self.scaler.is_enabled()
+            else self.update
+        )
 
     def train(self):
         """
@@ -97,42 +199,43 @@ class Trainer:
                 self.current_epoch = i
                 self.model.train()
                 losses = []
-                for t_batch in self.train_data:
+                for t_batch in prefetch_to_device(self.train_data, self.device):
                     t_batch['epoch'] = i
-                    t_batch = move_batch_to_device(t_batch, self.device)
-                    output = self.model(t_batch)
                     self.optimizer.zero_grad()
-                    output[self.train_metric].backward()
-                    torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
-                    self.optimizer.step()
+                    output = self.backward(t_batch) if self.microbatch_size is None else self.accumulate(t_batch)
+                    self.compiled_update()
                     losses.append(output[self.train_metric])
                     self.callback.end_batch(self, output)
 
                 output[f'mean_{self.train_metric}'] = torch.mean(torch.stack(losses))
                 self.callback.begin_epoch(self, output)
 
-                if self.lr_scheduler is not None:
-                    self.lr_scheduler.step(output[f'mean_{self.train_metric}'])
-
                 with torch.set_grad_enabled(self.model.grad_inference):
                     self.model.eval()
                     losses = []
-                    for d_batch in self.dev_data:
-                        d_batch = move_batch_to_device(d_batch, self.device)
-                        eval_output = self.model(d_batch)
+                    for d_batch in self.dev_batches():
+                        eval_output = self.compiled_model(d_batch)
                         losses.append(eval_output[self.dev_metric])
                     eval_output[f'mean_{self.dev_metric}'] = torch.mean(torch.stack(losses))
                     output = {**output, **eval_output}
+                    # the scheduler reads the loss on the host, so it steps once the validation pass is queued
+                    # and waits for both passes with the single synchronization of the model selection below
+                    if self.lr_scheduler is not None:
+                        self.lr_scheduler.step(output[f'mean_{self.train_metric}'])
                     self.callback.begin_eval(self, output)  # potential simulator
 
-                    if (self._eval_min and output[self.eval_metric] < self.best_devloss)\
-                            or (not self._eval_min and output[self.eval_metric] > self.best_devloss):
-                        self.best_model = deepcopy(self.model.state_dict())
-                        self.best_devloss = output[self.eval_metric]
+                    devloss = torch.as_tensor(output[self.eval_metric]).detach()
+                    improved = devloss < self.best_devloss if self._eval_min else devloss > self.best_devloss
+                    # the only host synchronization of the epoch, it decides the snapshot and early stopping
+                    improved = improved.item()
+                    if improved and i % self.snapshot_interval == 0:
+                        self._save_best()
+                        self.best_devloss.copy_(devloss)
+                        self._best_dev_output = {k: v.detach() if isinstance(v, torch.Tensor) else v
+                                                 for k, v in eval_output.items()}
                         self.badcount = 0
-                    else:
-                        if i > self.warmup:
-                            self.badcount += 1
+                    elif not improved and i > self.warmup:
+                        self.badcount += 1
                     if self.logger is not None:
                         self.logger.log_metrics(output, step=i)
                     else:
@@ -148,6 +251,9 @@ class Trainer:
         except KeyboardInterrupt:
             print("Interrupted training loop.")
 
+        if self.best_model_path is not None:
+            self.best_model = torch.load(self.best_model_path, map_location=self.device)
+
         self.callback.end_train(self, output)  # write training visualizations
 
         if self.logger is not None:
@@ -157,21 +263,91 @@ class Trainer:
             })
         return self.best_model
 
+    def dev_batches(self):
+        """
+        :return: (iterable of dict) Validation batches on the device, collated and copied only once with cache_dev_data
+        """
+        if not self.cache_dev_data:
+            return prefetch_to_device(self.dev_data, self.device)
+        if self._dev_batches is None:
+            self._dev_batches = list(prefetch_to_device(self.dev_data, self.device))
+        return self._dev_batches
+
+    def backward(self, batch, weight=1.0):
+        """
+        Forward pass of the problem and backward pass of its weighted training loss.
+
+        :param batch: (dict, {str: torch.Tensor}) Training batch on the device
+        :param weight: (float) Scale of the loss gradient
+        :return: (dict, {str: torch.Tensor}) Output of the problem
+        """
+        with torch.autocast(device_type=torch.device(self.device).type, dtype=self.amp_dtype, enabled=self.amp):
+            output = self.compiled_model(batch)
+        loss = output[self.train_metric]
+        self.scaler.scale(loss if weight == 1.0 else weight * loss).backward()
+        return output
+
+    def accumulate(self, batch):
+        """
+        Accumulate the gradient of a batch over slices of at most microbatch_size samples. Each slice is weighted by its
+        share of the batch, so for losses that average over samples the result matches a single backward pass.
+
+        :param batch: (dict, {str: torch.Tensor}) Training batch on the device, tensors are batch first
+        :return: (dict, {str: torch.Tensor}) Output of the last slice with the weighted training loss of the batch
+        """
+        nsamples = next(v.shape[0] for v in batch.values() if isinstance(v, torch.Tensor) and v.dim() > 0)
+        loss = 0.
+        for start in range(0, nsamples, self.microbatch_size):
+            end = min(start + self.microbatch_size, nsamples)
+            microbatch = {k: v[start:end] if isinstance(v, torch.Tensor) and v.dim() > 0 else v
+                          for k, v in batch.items()}
+            weight = (end - start) / nsamples
+            output = self.backward(microbatch, weight)
+            # detached so the graph of each slice is freed after its backward pass
+            loss = loss + weight * output[self.train_metric].detach()
+        output[self.train_metric] = loss
+        return output
+
+    def update(self):
+        """
+        Clip the gradients and take an optimizer step.
+        """
+        self.scaler.unscale_(self.optimizer)
+        torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.clip)
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+
+    def _save_best(self):
+        if self.best_model_path is None:
+            # snapshot in host memory, one copy per tensor without the deepcopy memo or a second copy on the device
+            state_dict = self.model.state_dict()
+            self.best_model = OrderedDict((k, v.detach().to("cpu", copy=True) if isinstance(v, torch.Tensor)
+                                           else deepcopy(v)) for k, v in state_dict.items())
+            # module versions used by load_state_dict
+            self.best_model._metadata = deepcopy(getattr(state_dict, "_metadata", None))
+        else:
+            torch.save(self.model.state_dict(), self.best_model_path)
+
     def test(self, best_model):
         """
-        Evaluate the model on all data splits.
+        Evaluate the model on all data splits. The validation output of the best model returned by train was already
+        computed in its epoch with the same parameters, so it is reused instead of running the validation data again.
         """
         self.model.load_state_dict(best_model, strict=False)
         self.model.eval()
+        dev_output = self._best_dev_output if best_model is self.best_model else None
 
         with torch.set_grad_enabled(self.model.grad_inference):
             self.callback.begin_test(self)  # setup simulator
             output = {}
             for dset, metric in zip([self.train_data, self.dev_data, self.test_data],
                                     [self.train_metric, self.dev_metric, self.test_metric]):
+                if dev_output is not None and dset is self.dev_data and metric == self.dev_metric:
+                    # mean loss and last batch output of the validation pass, as computed below
+                    output = {**output, **dev_output}
+                    continue
                 losses = []
-                for batch in dset:
-                    batch = move_batch_to_device(batch, self.device)
+                for batch in prefetch_to_device(dset, self.device):
                     batch_output = self.model(batch)
                     losses.append(batch_output[metric])
                 output[f'mean_{metric}'] = torch.mean(torch.stack(losses))
@@ -6,6 +6,7 @@ import os
 
 # machine learning/data science imports
 import numpy as np
+import torch
 import matplotlib.pyplot as plt
 import scipy.linalg as LA
 import matplotlib.patches as mpatches
@@ -20,6 +21,36 @@ from neuromancer.plot import plot_policy, plot_policy_train, \
 import neuromancer.blocks as blocks
 
 
+def to_numpy(tensors):
+    """
+    Copy tensors to numpy arrays on the host. CUDA tensors are copied asynchronously into pinned buffers, so all
+    transfers are queued at once and the host waits for them a single time instead of once per tensor.
+    A list of tensors is joined along the first dimension by copying each part into its slice of a single
+    preallocated buffer, instead of concatenating them on the device or on the host first.
+
+    :param tensors: (list of torch.Tensor or of lists of torch.Tensor)
+    :return: (list of np.ndarray)
+    """
+    host, devices = [], set()
+    for parts in tensors:
+        parts = [parts] if isinstance(parts, torch.Tensor) else parts
+        cuda = any(p.is_cuda for p in parts)
+        if len(parts) == 1 and not cuda:
+            host.append(parts[0].detach())
+            continue
+        buffer = torch.empty((sum(p.shape[0] for p in parts), *parts[0].shape[1:]), dtype=parts[0].dtype,
+                             pin_memory=cuda)
+        start = 0
+        for p in parts:
+            buffer[start:start + p.shape[0]].copy_(p.detach(), non_blocking=True)
+            start += p.shape[0]
+        devices.update(p.device for p in parts if p.is_cuda)
+        host.append(buffer)
+    for device in devices:
+        torch.cuda.synchronize(device)
+    return [t.numpy() for t in host]
+
+
 class Visualizer:
 
     def train_plot(self, outputs, epochs):
@@ -175,26 +206,22 @@ class VisualizerOpen(Visualizer):
         """
         dsets = ['train', 'dev', 'test']
         ny = outputs["nstep_train_Y_pred_dynamics"].shape[-1]
-        # Ypred = [unbatch_tensor(outputs[f'nstep_{dset}_Y_pred_dynamics']).reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        # Ytrue = [unbatch_tensor(outputs[f'nstep_{dset}_Yf']).reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        Ypred = [outputs[f'nstep_{dset}_Y_pred_dynamics'].reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        Ytrue = [outputs[f'nstep_{dset}_Yf'].reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
 
-        self.plot_traj(np.concatenate(Ytrue).transpose(1, 0),
-                       np.concatenate(Ypred).transpose(1, 0),
-                       figname=os.path.join(self.savedir, 'nstep_loop.png'))
+        def trajectory(key):
+            # the splits are joined in a single host buffer by to_numpy
+            return [outputs[key.format(dset)].reshape(-1, ny) for dset in dsets]
+
+        nstep_true, nstep_pred, Ytrue, Ypred = (y.T for y in to_numpy([
+            trajectory('nstep_{}_Yf'), trajectory('nstep_{}_Y_pred_dynamics'),
+            trajectory('loop_{}_Yf'), trajectory('loop_{}_Y_pred_dynamics')]))
+        self.plot_traj(nstep_true, nstep_pred, figname=os.path.join(self.savedir, 'nstep_loop.png'))
 
         figname = self.figname if self.figname is not None else os.path.join(self.savedir, 'open_loop.png')
-        Ypred = [outputs[f'loop_{dset}_Y_pred_dynamics'].reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        Ytrue = [outputs[f'loop_{dset}_Yf'].reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        self.plot_traj(np.concatenate(Ytrue).transpose(1, 0),
-                       np.concatenate(Ypred).transpose(1, 0),
-                       figname=figname)
+        self.plot_traj(Ytrue, Ypred, figname=figname)
         self.plot_matrix()
 
         if self.trace_movie:
-            plot.trajectory_movie(np.concatenate(Ytrue).transpose(1, 0),
-                                  np.concatenate(Ypred).transpose(1, 0),
+            plot.trajectory_movie(Ytrue, Ypred,
                                   figname=os.path.join(self.savedir, f'open_movie.mp4'),
                                   freq=self.verbosity)
         return dict()
@@ -236,18 +263,15 @@ class VisualizerUncertaintyOpen(Visualizer):
         dsets = ['train', 'dev', 'test']
         ny = self.dataset.dims['Yf'][-1]
 
-        Ypred = [outputs[f'loop_{dset}_Y_pred_{self.dynamics_name}'].reshape(-1, ny).detach().cpu().numpy() for dset in
-                 dsets]
-        Ymean = [outputs[f'loop_{dset}_Y_pred_{self.dynamics_name}_mean'].reshape(-1, ny).detach().cpu().numpy() for
-                 dset in dsets]
-        Ystd = [outputs[f'loop_{dset}_Y_pred_{self.dynamics_name}_std'].reshape(-1, ny).detach().cpu().numpy() for dset
-                in dsets]
-        Ytrue = [outputs[f'loop_{dset}_Yf'].reshape(-1, ny).detach().cpu().numpy() for dset in dsets]
-        self.plot_traj(np.concatenate(Ytrue).transpose(1, 0),
-                       np.concatenate(Ypred).transpose(1, 0),
-                       np.concatenate(Ymean).transpose(1, 0),
-                       np.concatenate(Ystd).transpose(1, 0),
-                       figname=os.path.join(self.savedir, 'open_loop.png'))
+        def trajectory(key):
+            # the splits are joined in a single host buffer by to_numpy
+            return [outputs[key.format(dset)].reshape(-1, ny) for dset in dsets]
+
+        Ytrue, Ypred, Ymean, Ystd = (y.T for y in to_numpy([
+            trajectory('loop_{}_Yf'), trajectory(f'loop_{{}}_Y_pred_{self.dynamics_name}'),
+            trajectory(f'loop_{{}}_Y_pred_{self.dynamics_name}_mean'),
+            trajectory(f'loop_{{}}_Y_pred_{self.dynamics_name}_std')]))
+        self.plot_traj(Ytrue, Ypred, Ymean, Ystd, figname=os.path.join(self.savedir, 'open_loop.png'))
         return dict()
 
 
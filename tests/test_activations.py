@@ -1,6 +1,6 @@
 import torch
 from hypothesis import given, settings, strategies as st
-from neuromancer.activations import activations
+from neuromancer.activations import activations, soft_exp, _soft_exp_branchless
 
 activations = [v for k, v in activations.items()]
 
@@ -24,4 +24,13 @@ def test_NaN_init(batchsize, insize, act):
     model = act()
     x = torch.randn([batchsize, insize])
     y = model(x)
-    assert not y.isnan().any()
\ No newline at end of file
+    assert not y.isnan().any()
+
+
+@given(st.integers(1, 500),
+       st.floats(-1.0, 1.0))
+@settings(max_examples=100, deadline=None)
+def test_soft_exp_branchless(batchsize, alpha):
+    x = 0.1*torch.randn([batchsize])
+    alpha = torch.tensor(alpha)
+    assert torch.allclose(soft_exp(alpha, x), _soft_exp_branchless(alpha, x), equal_nan=True)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from neuromancer.blocks import Poly2, MLP, ResMLP, RNN, BilinearTorch, PytorchRNN, Linear
+from neuromancer.blocks import Poly2, MLP, ResMLP, RNN, BilinearTorch, PytorchRNN, Linear, InputConvexNN, PosDef
 import torch
 from hypothesis import given, settings, strategies as st
 import slim
@@ -41,6 +41,51 @@ def test_mlp_shape(batchsize, insize, outsize, bias, hsizes, lin, act):
     assert y.shape[0] == batchsize and y.shape[1] == outsize
 
 
+@given(st.integers(1, 50),
+       st.integers(1, 50),
+       st.integers(1, 50),
+       st.lists(st.integers(1, 50),
+                min_size=0, max_size=3))
+@settings(max_examples=5, deadline=None)
+def test_compiled_mlp_matches_eager(batchsize, insize, outsize, hsizes):
+    model = MLP(insize, outsize, hsizes=hsizes, compiled=True)
+    x = torch.randn([batchsize, insize])
+    assert torch.allclose(model(x), model.forward(x), atol=1e-5)
+
+
+@given(st.integers(1, 500),
+       st.integers(1, 500),
+       st.integers(1, 500),
+       st.booleans(),
+       st.integers(1, 100),
+       st.integers(1, 10),
+       st.sampled_from(activations))
+@settings(max_examples=100, deadline=None)
+def test_stacked_mlp_shape(batchsize, insize, outsize, bias, hsize, nlayers, act):
+    model = MLP(insize, outsize, bias=bias, hsizes=[hsize for k in range(nlayers)], nonlin=act, stacked=True)
+    x = torch.randn([batchsize, insize])
+    y = model(x)
+    assert y.shape[0] == batchsize and y.shape[1] == outsize
+
+
+@given(st.integers(1, 50),
+       st.integers(1, 50),
+       st.integers(1, 50),
+       st.integers(1, 10),
+       st.sampled_from([MLP, ResMLP]))
+@settings(max_examples=20, deadline=None)
+def test_checkpointed_mlp_gradients(batchsize, insize, outsize, nlayers, implementation):
+    torch.manual_seed(0)
+    model = implementation(insize, outsize, hsizes=[8 for k in range(nlayers)])
+    torch.manual_seed(0)
+    checkpointed = implementation(insize, outsize, hsizes=[8 for k in range(nlayers)], checkpointed=True)
+    x = torch.randn([batchsize, insize])
+    model(x).sum().backward()
+    checkpointed(x).sum().backward()
+    for p, q in zip(model.parameters(), checkpointed.parameters()):
+        # SoftExponential at alpha == 0 is the identity and leaves alpha without a gradient
+        assert (p.grad is None and q.grad is None) or torch.allclose(p.grad, q.grad, atol=1e-5)
+
 @given(st.integers(1, 500),
        st.integers(1, 500),
        st.integers(1, 500),
@@ -95,6 +140,29 @@ def test_poly2_shape(batchsize, insize):
     x = torch.randn([batchsize, insize])
     y = model(x)
     assert y.shape[0] == batchsize and y.shape[1] == (insize*(insize + 1))/2 + insize
+    assert y.shape[1] == model.expanded_size(insize)
+
+
+@given(st.integers(1, 100),
+       st.integers(1, 50),
+       st.booleans())
+@settings(max_examples=100, deadline=None)
+def test_poly2_matches_outer_product(batchsize, insize, numba):
+    model = Poly2(numba=numba)
+    x = torch.randn([batchsize, insize])
+    rows, cols = torch.triu_indices(insize, insize)
+    outer = torch.matmul(x.unsqueeze(-1), x.unsqueeze(1))
+    assert torch.allclose(model(x), torch.cat([x, outer[:, rows, cols]], dim=-1))
+
+
+@given(st.integers(1, 10),
+       st.integers(1, 10))
+@settings(max_examples=20, deadline=None)
+def test_poly2_numba_func_transforms(batchsize, insize):
+    x = torch.randn([batchsize, insize])
+    for transform in [torch.func.vmap, torch.func.jacrev]:
+        expected = transform(Poly2())(x)
+        assert torch.allclose(transform(Poly2(numba=True))(x), expected)
 
 
 @given(st.integers(1, 500),
@@ -108,3 +176,47 @@ def test_basis_linear_shape(batchsize, insize, outsize, bias, lin):
     x = torch.randn([batchsize, insize])
     y = model(x)
     assert y.shape[0] == batchsize and y.shape[1] == outsize
+
+
+@given(st.integers(1, 500),
+       st.integers(1, 50),
+       st.integers(1, 50),
+       st.integers(1, 10),
+       st.booleans())
+@settings(max_examples=50, deadline=None)
+def test_icnn_shape(batchsize, insize, outsize, nlayers, stacked):
+    model = InputConvexNN(insize, outsize, hsizes=[16 for k in range(nlayers)], stacked=stacked)
+    x = torch.randn([batchsize, insize])
+    y = model(x)
+    assert y.shape[0] == batchsize and y.shape[1] == outsize
+
+
+@given(st.integers(1, 500),
+       st.integers(1, 50))
+@settings(max_examples=20, deadline=None)
+def test_posdef_eval_cache(batchsize, insize):
+    model = PosDef(InputConvexNN(insize, 1, hsizes=[16, 16]))
+    x = torch.randn([batchsize, insize])
+    y = model(x)
+    model.eval()
+    assert torch.allclose(model(x), y, atol=1e-6)
+    with torch.no_grad():
+        for p in model.g.parameters():
+            p.add_(0.1)
+    cached = model(x)
+    model.train()
+    assert torch.allclose(cached, model(x), atol=1e-6)
+    model.eval()
+    model(x)
+    model.double()
+    assert model.g_zero().dtype == torch.float64
+    assert torch.allclose(model(x.double()), model.train()(x.double()))
+
+
+@given(st.integers(1, 50))
+@settings(max_examples=5, deadline=None)
+def test_posdef_origin_buffer(insize):
+    model = PosDef(InputConvexNN(insize, 1, hsizes=[16, 16]))
+    assert all(p is not model.zero for p in model.parameters())
+    assert 'zero' in model.state_dict()
+    model.load_state_dict(model.state_dict())
@@ -252,6 +252,31 @@ def test_eq_mse_variables(shape):
     assert cnstr(data)[cnstr.key] == 0.
 
 
+@given(st.lists(st.integers(1, 100), min_size=1, max_size=4),
+       st.floats(-1., 1.))
+@settings(max_examples=10, deadline=None)
+def test_eq_norm_losses(shape, const):
+    x = cn.variable('x')
+    y = cn.variable('y')
+    data = {'x': torch.randn(shape), 'y': torch.full(shape, const)}
+    l1, l2 = x == y, (x == y)^2
+    assert torch.allclose(l1(data)[l1.key], torch.nn.functional.l1_loss(data['x'], data['y']))
+    assert torch.allclose(l2(data)[l2.key], torch.nn.functional.mse_loss(data['x'], data['y']))
+
+
+@given(st.lists(st.integers(1, 100), min_size=1, max_size=4))
+@settings(max_examples=10, deadline=None)
+def test_zero_right_losses(shape):
+    x = cn.variable('x')
+    zero = cn.variable(torch.zeros(1))
+    data = {'x': torch.randn(shape)}
+    eq, lt, gt = (x == zero)^2, (x < zero)^2, (x > zero)^2
+    assert eq._zero_right and lt._zero_right and gt._zero_right
+    assert torch.allclose(eq(data)[eq.key], torch.nn.functional.mse_loss(data['x'], torch.zeros(shape)))
+    assert torch.allclose(lt(data)[lt.key], torch.relu(data['x']).pow(2).mean())
+    assert torch.allclose(gt(data)[gt.key], torch.relu(-data['x']).pow(2).mean())
+
+
 @given(st.lists(st.integers(1, 100), min_size=1, max_size=4))
 @settings(max_examples=10, deadline=None)
 def test_lt_variables(shape):
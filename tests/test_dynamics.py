@@ -189,3 +189,67 @@ def test_ode_nonauto_inputs_shape(samples, nsteps, nx, nu, hsize, nlayers, integ
     assert output[f'Y_pred_{model.name}'].shape[2] == nx
 
 
+
+
+@given(st.integers(1, 10),
+       st.integers(1, 12),
+       st.integers(1, 5),
+       st.one_of(st.integers(1, 4), st.just(True)),
+       st.sampled_from([True, False]))
+@settings(max_examples=50, deadline=None)
+def test_block_ssm_checkpointed_gradients(samples, nsteps, nx, segments, residual):
+    x = torch.rand(samples, nx)
+    U = torch.rand(samples, nsteps, 2)
+    Y = torch.rand(samples, nsteps, 2)
+    data = {'x0': x, 'Uf': U, 'Yf': Y}
+    fx, fu, fe = MLP(nx, nx, hsizes=[4]), MLP(2, nx, hsizes=[4]), MLP(nx, nx, hsizes=[4])
+    fy = MLP(nx, 2, hsizes=[4])
+    grads = []
+    for checkpoint_segments in [0, segments]:
+        model = dynamics.BlockSSM(fx, fy, fu=fu, fe=fe, residual=residual, checkpoint_segments=checkpoint_segments)
+        model.zero_grad()
+        output = model(data)
+        (output['X_pred_block_ssm'].sum() + output['Y_pred_block_ssm'].sum()).backward()
+        grads.append([p.grad.clone() for p in model.parameters() if p.grad is not None])
+    assert all(torch.allclose(g, gc, rtol=1e-4, atol=1e-5) for g, gc in zip(*grads))
+
+
+@given(st.integers(1, 10),
+       st.integers(1, 6),
+       st.integers(1, 5),
+       st.integers(0, 3))
+@settings(max_examples=50, deadline=None)
+def test_block_ssm_unstacked_outputs(samples, nsteps, nx, segments):
+    x = torch.rand(samples, nx)
+    U = torch.rand(samples, nsteps, 2)
+    Y = torch.rand(samples, nsteps, 2)
+    data = {'x0': x, 'Uf': U, 'Yf': Y}
+    fx, fu, fy = MLP(nx, nx, hsizes=[4]), MLP(2, nx, hsizes=[4]), MLP(nx, 2, hsizes=[4])
+    stacked = dynamics.BlockSSM(fx, fy, fu=fu, checkpoint_segments=segments)(data)
+    unstacked = dynamics.BlockSSM(fx, fy, fu=fu, checkpoint_segments=segments, stack_outputs=False)(data)
+    for k in ['X_pred_block_ssm', 'Y_pred_block_ssm']:
+        assert isinstance(unstacked[k], tuple) and len(unstacked[k]) == nsteps
+        assert torch.allclose(torch.stack(unstacked[k], dim=1), stacked[k])
+    assert torch.equal(unstacked['fU_block_ssm'], stacked['fU_block_ssm'])
+
+
+@given(st.integers(1, 10),
+       st.integers(1, 8),
+       st.integers(1, 5),
+       st.integers(0, 3),
+       st.sampled_from([True, False]))
+@settings(max_examples=50, deadline=None)
+def test_linear_ssm_affine_rollout(samples, nsteps, nx, segments, residual):
+    x = torch.rand(samples, nx)
+    U = torch.rand(samples, nsteps, 2)
+    Y = torch.rand(samples, nsteps, 2)
+    data = {'x0': x, 'Uf': U, 'Yf': Y}
+    fx, fu, fy = torch.nn.Linear(nx, nx), torch.nn.Linear(2, nx), torch.nn.Linear(nx, 2)
+    output = dynamics.BlockSSM(fx, fy, fu=fu, residual=residual, checkpoint_segments=segments)(data)
+    X = []
+    for i in range(nsteps):
+        x = fx(x) + fu(U[:, i]) + (x if residual else 0.)
+        X.append(x)
+    X = torch.stack(X, dim=1)
+    assert torch.allclose(output['X_pred_block_ssm'], X, atol=1e-5)
+    assert torch.allclose(output['Y_pred_block_ssm'], fy(X), atol=1e-5)
@@ -58,4 +58,24 @@ def test_fully_observable_shape(samples, nsteps, nx):
     output = model(data)
     x0 = output[model.output_keys[0]]
     assert x0.shape[0] == samples
-    assert x0.shape[1] == nx
\ No newline at end of file
+    assert x0.shape[1] == nx
+
+@given(st.integers(1, 10),
+       st.integers(1, 5),
+       st.integers(1, 3),
+       st.integers(1, 3),
+       st.floats(0.1, 1.0))
+@settings(max_examples=200, deadline=None)
+def test_time_delay_features(samples, nsteps, ny, nu, window):
+    data_dims = {'x0': (ny,), 'x1': (ny,), 'Yp': (samples, ny), 'Up': (samples, nu)}
+    window_size = math.ceil(window*nsteps)
+    data = {'x1': torch.rand(samples, ny), 'Yp': torch.rand(samples, nsteps + 1, ny, requires_grad=True),
+            'Up': torch.rand(samples, nsteps + 1, nu)}
+    model = estim.TimeDelayEstimator(data_dims, nsteps=nsteps, window_size=window_size, input_keys=['x1', 'Yp', 'Up'])
+    features = model.features(data)
+    expected = torch.cat([data['x1']] + [data[k][:, nsteps - window_size:nsteps, :].reshape(samples, -1)
+                                         for k in ['Yp', 'Up']], dim=1)
+    assert features.shape[1] == model.in_features
+    assert torch.equal(features, expected)
+    features.sum().backward()
+    assert data['Yp'].grad[:, nsteps - window_size:nsteps].eq(1.).all()
@@ -0,0 +1,27 @@
+import torch
+from hypothesis import given, settings, strategies as st
+from neuromancer.gradients import jacobian, gradient
+
+
+@given(st.integers(1, 20),
+       st.integers(1, 20))
+@settings(max_examples=50, deadline=None)
+def test_jacobian_matches_autograd(ny, nx):
+    A = torch.randn(ny, nx)
+    f = lambda z: torch.tanh(A @ z) * z.sum()
+    x = torch.randn(nx, requires_grad=True)
+    J = jacobian(f(x), x)
+    assert J.shape == (ny, nx)
+    assert torch.allclose(J, torch.autograd.functional.jacobian(f, x), atol=1e-5)
+
+
+@given(st.integers(1, 20),
+       st.integers(1, 20))
+@settings(max_examples=50, deadline=None)
+def test_gradient_multiple_inputs(nz, np):
+    z = torch.randn(nz, requires_grad=True)
+    p = torch.randn(np, requires_grad=True)
+    y = torch.sin(z).sum() * torch.cos(p).sum()
+    gz, gp = gradient(y, [z, p])
+    assert torch.allclose(gz, gradient(y, z))
+    assert torch.allclose(gp, gradient(y, p))
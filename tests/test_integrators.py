@@ -114,3 +114,15 @@ def test_integrator_black_ode_non_auto_online_shape(batchsize, nx, nu, integrato
     t = torch.randn([batchsize, 2, 1])
     y = model(x, u, t)
     assert y.shape[0] == batchsize and y.shape[1] == nx
+
+
+@given(st.integers(1, 100),
+       st.integers(1, 10))
+@settings(max_examples=50, deadline=None)
+def test_multistep_batched_block(batchsize, nx):
+    fx = MLP(nx, nx, bias=True, hsizes=[20, 20], linear_map=slim.maps['linear'])
+    x = torch.randn([4, batchsize, nx])
+    y = integrators.MultiStep_PredictorCorrector(fx)(x)
+    y_batched = integrators.MultiStep_PredictorCorrector(fx, batched_block=True)(x)
+    assert y.shape == (batchsize, nx)
+    assert torch.allclose(y, y_batched, atol=1e-5)